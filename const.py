@@ -3,9 +3,9 @@ import const
 """
 运行模式
 可以是追加模式append或覆盖模式overwrite
-append模式：仅可在sqlite启用时使用。每次运行每个id只获取最新的微博，对于以往的即使是编辑过的微博，也不再获取。
+append模式：需要启用crawl_state。每次运行每个id只获取最新的微博，遇到上次获取到的最新微博即停止，对于以往的即使是编辑过的微博，也不再获取。
 overwrite模式：每次运行都会获取全量微博。
-注意：overwrite模式下暂不能记录上次获取微博的id，因此从overwrite模式转为append模式时，仍需获取所有数据
+两种模式都会在用户抓取完毕后把最新微博的id和时间记录到crawl_state中，因此从overwrite模式转为append模式时不需要重新获取所有数据
 """
 const.MODE = "overwrite"
 
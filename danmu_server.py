@@ -12,10 +12,13 @@ import aiohttp
 import os
 import subprocess
 import signal
-import re
 import requests
 import time
 
+from util.schema import migrate
+from util.transport import Transport
+from util.weibo_id import is_mid, normalize_input, resolve_mid
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -48,8 +51,33 @@ CRAWLER_TASKS = {}  # 存储爬虫任务的字典
 # 新增：管理当前活跃的评论爬虫进程
 ACTIVE_COMMENT_PROCS = {}
 
+# 访问微博接口使用的session，按config.json中的transport配置录制/回放请求
+HTTP_SESSION = None
+
+def get_session():
+    """获取访问微博接口的session，首次调用时创建"""
+    global HTTP_SESSION
+    if HTTP_SESSION is None:
+        HTTP_SESSION = requests.Session()
+        try:
+            with open('config.json', encoding='utf-8') as f:
+                transport_config = json.load(f).get('transport')
+        except Exception as e:
+            logger.error(f"读取transport配置失败: {e}")
+            transport_config = None
+        transport = Transport.from_config(
+            transport_config, os.path.split(os.path.realpath(__file__))[0]
+        )
+        if transport:
+            transport.mount(HTTP_SESSION)
+    return HTTP_SESSION
+
 def get_weibo_id_by_bid(bid, cookie):
-    """通过BID获取微博ID"""
+    """通过BID获取微博ID，BID在本地解码，只有无法识别的格式才请求网络"""
+    return resolve_mid(bid, lambda id_str: fetch_weibo_id(id_str, cookie))
+
+def fetch_weibo_id(bid, cookie):
+    """通过微博接口获取微博ID"""
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",
         "Cookie": cookie
@@ -61,7 +89,7 @@ def get_weibo_id_by_bid(bid, cookie):
         logger.info(f"正在请求URL: {url}")
         logger.info(f"Headers: {headers}")
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = get_session().get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
         # 先看看原始响应
@@ -98,11 +126,7 @@ def get_weibo_id_by_bid(bid, cookie):
 
 def is_weibo_id(id_str):
     """判断是否为微博ID（数字）"""
-    return id_str.isdigit()
-
-def is_bid(id_str):
-    """判断是否为BID（字母数字组合）"""
-    return bool(re.match(r'^[A-Za-z0-9]+$', id_str))
+    return is_mid(id_str)
 
 def load_config():
     """加载弹幕配置"""
@@ -113,23 +137,24 @@ def load_config():
     except Exception as e:
         logger.warning(f"加载配置文件失败: {e}，使用默认配置")
 
+def migrate_database():
+    """启动时把数据库升级到与爬虫相同的表结构，表不存在时一并创建"""
+    try:
+        os.makedirs('./weibo', exist_ok=True)
+        conn = sqlite3.connect('./weibo/weibodata.db')
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"升级数据库失败: {e}")
+
 async def get_latest_comments():
     """从数据库获取最新的评论"""
     global LAST_COMMENT_TIME
     try:
         conn = sqlite3.connect('./weibo/weibodata.db')
         cursor = conn.cursor()
-        # 检查comments表是否存在，不存在则创建
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS comments (
-                id varchar(20) NOT NULL,
-                weibo_id varchar(32) NOT NULL,
-                user_screen_name varchar(64) NOT NULL,
-                text varchar(1000),
-                created_at varchar(20),
-                PRIMARY KEY (id)
-            );
-        """)
         # 获取最新的n条评论，按照 id 降序排序确保获取最新的评论
         query = """
         SELECT id, user_screen_name, text, created_at
@@ -419,21 +444,33 @@ async def update_cookie(request):
             'message': f'更新Cookie失败: {str(e)}'
         }, status=500)
 
+async def captcha_resolved(request):
+    """通知爬虫验证码已处理：修改标记文件，隔离区中的用户会立即重试"""
+    try:
+        with open('config.json', encoding='utf-8') as f:
+            quarantine_config = json.load(f).get('captcha_quarantine') or {}
+        marker_file = Path(quarantine_config.get('marker_file') or 'weibo/captcha_resolved')
+        marker_file.parent.mkdir(parents=True, exist_ok=True)
+        marker_file.write_text(datetime.now().isoformat(), encoding='utf-8')
+        logger.info(f"已更新验证码标记文件: {marker_file}")
+        return web.json_response({
+            'success': True,
+            'message': '已通知爬虫重试被验证码阻断的用户'
+        })
+    except Exception as e:
+        logger.error(f"更新验证码标记文件失败: {e}")
+        return web.json_response({
+            'success': False,
+            'message': f'更新验证码标记文件失败: {str(e)}'
+        }, status=500)
+
 async def serve_cookie_manager(request):
     """提供Cookie管理页面"""
     return web.FileResponse('./cookie_manager.html')
 
 def extract_id_from_input(input_str):
     """从输入中提取ID，支持完整链接、BID和微博ID"""
-    # 如果包含/，取最后一个部分
-    if '/' in input_str:
-        input_str = input_str.split('/')[-1]
-    
-    # 去除可能的查询参数
-    if '?' in input_str:
-        input_str = input_str.split('?')[0]
-        
-    return input_str.strip()
+    return normalize_input(input_str)
 
 async def start_crawler(request):
     """启动爬虫"""
@@ -489,11 +526,13 @@ async def init_app():
     app.router.add_get('/danmu', serve_danmu_html)
     app.router.add_get('/cookie', serve_cookie_manager)  # 新增Cookie管理页面路由
     app.router.add_post('/update_cookie', update_cookie)  # 新增Cookie更新路由
+    app.router.add_post('/captcha_resolved', captcha_resolved)  # 验证码处理完成，通知爬虫重试
     app.router.add_get('/ws', websocket_handler)
     app.router.add_post('/start_crawler', start_crawler)
     
     # 加载配置
     load_config()
+    migrate_database()
     
     # 启动评论广播任务
     asyncio.create_task(broadcast_comments())
@@ -532,7 +571,7 @@ def get_latest_5_weibo_ids(user_id, cookie):
         'Cookie': cookie
     }
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = get_session().get(url, headers=headers, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         cards = data.get('data', {}).get('cards', [])
@@ -611,7 +650,7 @@ def get_latest_n_weibo_ids(user_id, cookie, n):
         'Cookie': cookie
     }
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = get_session().get(url, headers=headers, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         cards = data.get('data', {}).get('cards', [])
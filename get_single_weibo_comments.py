@@ -5,15 +5,18 @@ import json
 import logging
 import logging.config
 import os
-import random
-import sqlite3
-from collections import OrderedDict
 from time import sleep
 import requests
 from requests.adapters import HTTPAdapter
 import re
-from datetime import datetime
 from weibo import Weibo
+from util.dateutil import standardize_date
+from util.html_extract import strip_tags
+from util.ratelimit import RateLimiter, get_endpoint
+from util.records import COMMENT_TABLE, CommentRecord
+from util.sqlite_db import SQLiteDB
+from util.transport import Transport
+from util.weibo_id import is_mid, normalize_input, resolve_mid
 import sys
 import signal
 import colorama
@@ -72,7 +75,7 @@ def signal_handler(signum, frame):
     print(f"\n{Fore.YELLOW}正在停止程序...{Style.RESET_ALL}")
     running = False
 
-def get_weibo_id_by_bid(bid, cookie):
+def get_weibo_id_by_bid(bid, cookie, session=None):
     """通过BID获取微博ID"""
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",
@@ -82,7 +85,7 @@ def get_weibo_id_by_bid(bid, cookie):
     try:
         # 使用新的API直接获取微博信息
         url = f"https://weibo.com/ajax/statuses/show?id={bid}"
-        response = requests.get(url, headers=headers, timeout=10)
+        response = (session or requests).get(url, headers=headers, timeout=10)
         response.raise_for_status()
         data = response.json()
         
@@ -98,18 +101,30 @@ def get_weibo_id_by_bid(bid, cookie):
         return None
 
 class WeiboCommentCrawler:
-    def __init__(self, input_id, cookie):
+    def __init__(self, input_id, cookie, rate_limit=None, transport=None):
         """初始化爬虫
         
         Args:
             input_id: 可以是BID或微博ID
             cookie: 微博cookie
+            rate_limit: 各接口每秒请求数，与config.json中的rate_limit相同
+            transport: 与config.json中的transport相同，用于录制/回放请求
         """
         self.input_id = input_id
         self.cookie = cookie
+        self.session = requests.Session()
+        adapter = HTTPAdapter(max_retries=5)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.transport = Transport.from_config(
+            transport, os.path.split(os.path.realpath(__file__))[0]
+        )
+        if self.transport:
+            self.transport.mount(self.session)
         
-        # 判断输入ID类型并获取微博ID
-        if input_id.isdigit():
+        # 判断输入ID类型并获取微博ID，BID在本地解码，只有无法识别的格式才请求网络
+        input_id = normalize_input(input_id)
+        if is_mid(input_id):
             # 如果输入的是微博ID
             self.weibo_id = input_id
             self.bid = None
@@ -117,7 +132,9 @@ class WeiboCommentCrawler:
         else:
             # 如果输入的是BID
             self.bid = input_id
-            self.weibo_id = get_weibo_id_by_bid(input_id, cookie)
+            self.weibo_id = resolve_mid(
+                input_id, lambda bid: get_weibo_id_by_bid(bid, cookie, self.session)
+            )
             if not self.weibo_id:
                 raise ValueError(f"无法获取BID为 {input_id} 的微博ID")
             logger.info(f"初始化爬虫完成: 输入ID={input_id}, 微博ID={self.weibo_id}, BID={self.bid}")
@@ -126,11 +143,9 @@ class WeiboCommentCrawler:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",
             "Cookie": cookie
         }
-        self.session = requests.Session()
-        adapter = HTTPAdapter(max_retries=5)
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
         self.known_comment_ids = set()  # 用于跟踪已知评论
+        self.sqlite_db = SQLiteDB("./weibo/weibodata.db")
+        self.rate_limiter = RateLimiter(rate_limit)
 
     def get_comments(self, batch_size=10):
         """获取指定微博的评论
@@ -180,6 +195,7 @@ class WeiboCommentCrawler:
         
         while retry_count < max_retries:
             try:
+                self.rate_limiter.acquire(get_endpoint(url), self.cookie)
                 response = self.session.get(url, params=params, headers=self.headers, timeout=10)
                 response.raise_for_status()
                 json_data = response.json()
@@ -199,9 +215,6 @@ class WeiboCommentCrawler:
                 if on_downloaded:
                     on_downloaded(weibo, comments)
 
-                # 随机睡眠以避免被限制
-                sleep(random.uniform(1, 2))
-
                 cur_count += count
                 next_page = json_data.get('max_id', 0) != 0 or (max_id or 1) * 20 < json_data.get('total_number', 0)
 
@@ -247,13 +260,15 @@ class WeiboCommentCrawler:
         if not comment:
             return None
             
-        sqlite_comment = OrderedDict()
+        sqlite_comment = CommentRecord()
         sqlite_comment["id"] = comment["id"]
+        sqlite_comment["bid"] = comment.get("bid") or ""
         sqlite_comment["weibo_id"] = self.weibo_id
+        sqlite_comment["user_id"] = comment.get("user", {}).get("id", "")
         sqlite_comment["user_screen_name"] = comment.get("user", {}).get("screen_name", "")
         
         # 移除HTML标签
-        text = re.sub('<[^<]+?>', '', comment.get("text", "")).replace('\n', '').strip()
+        text = strip_tags(comment.get("text", "")).replace('\n', '').strip()
         sqlite_comment["text"] = text
         
         # 转换时间格式
@@ -265,10 +280,8 @@ class WeiboCommentCrawler:
                     pass
                 # 否则转换微博时间格式
                 else:
-                    # 将微博时间格式转换为datetime对象
-                    dt = datetime.strptime(created_at, '%a %b %d %H:%M:%S +0800 %Y')
-                    # 转换为标准的ISO格式
-                    created_at = dt.strftime('%Y-%m-%d %H:%M:%S')
+                    # 将微博时间格式转换为标准格式，与语言区域设置无关且结果会被缓存
+                    created_at = standardize_date(created_at)[1]
             except Exception as e:
                 logger.error(f"时间格式转换失败: {e}, 原始时间: {created_at}")
                 created_at = ""
@@ -282,15 +295,10 @@ class WeiboCommentCrawler:
         if not comments:
             return
 
-        db_path = "./weibo/weibodata.db"
-        con = sqlite3.connect(db_path)
-        
-        for comment in comments:
-            data = self._parse_comment(comment)
-            if data:
-                self._insert_comment(con, data)
-        
-        con.close()
+        records = [self._parse_comment(comment) for comment in comments]
+        self.sqlite_db.insert_records("comments", COMMENT_TABLE, [r for r in records if r])
+        # 每一轮都提交，弹幕页面可以立即读到新评论
+        self.sqlite_db.commit()
         logger.info(f"已将 {len(comments)} 条新评论保存到数据库")
 
     def save_to_json(self, comments):
@@ -306,22 +314,13 @@ class WeiboCommentCrawler:
         for comment in comments:
             data = self._parse_comment(comment)
             if data:
-                json_comments.append(data)
+                json_comments.append(data.to_dict())
 
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(json_comments, f, ensure_ascii=False, indent=2)
         
         logger.info(f"已将 {len(comments)} 条评论保存到 {json_path}")
 
-    def _insert_comment(self, con, data):
-        """将评论插入数据库"""
-        cur = con.cursor()
-        keys = ",".join(data.keys())
-        values = ",".join(["?"] * len(data))
-        sql = f"""INSERT OR REPLACE INTO comments({keys}) VALUES({values})"""
-        cur.execute(sql, list(data.values()))
-        con.commit()
-
 def check_config():
     """检查配置文件是否存在且包含必要的信息"""
     if not os.path.exists("config.json"):
@@ -377,6 +376,8 @@ def main():
             with open("config.json", encoding="utf-8") as f:
                 config = json.load(f)
                 cookie = config.get("cookie", "")
+                rate_limit = config.get("rate_limit")
+                transport = config.get("transport")
         except Exception as e:
             print(f"{Fore.RED}错误：读取配置文件失败 - {e}{Style.RESET_ALL}")
             input("\n按回车键退出...")
@@ -388,32 +389,15 @@ def main():
         
         try:
             # 创建爬虫实例（内部会自动转换BID为微博ID）
-            crawler = WeiboCommentCrawler(target_bid, cookie)
+            crawler = WeiboCommentCrawler(target_bid, cookie, rate_limit, transport)
             print(f"{Fore.GREEN}已找到对应的微博ID: {crawler.weibo_id}{Style.RESET_ALL}")
         except ValueError as e:
             print(f"{Fore.RED}错误：{e}{Style.RESET_ALL}")
             input("\n按回车键退出...")
             return
 
-        # 创建数据库目录和表
-        db_path = "./weibo/weibodata.db"
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-
-        con = sqlite3.connect(db_path)
-        cur = con.cursor()
-        create_comments_table = """
-        CREATE TABLE IF NOT EXISTS comments (
-            id varchar(20) NOT NULL,
-            weibo_id varchar(32) NOT NULL,
-            user_screen_name varchar(64) NOT NULL,
-            text varchar(1000),
-            created_at varchar(20),
-            PRIMARY KEY (id)
-        );
-        """
-        cur.execute(create_comments_table)
-        con.commit()
-        con.close()
+        # 创建数据库目录和表，与weibo.py使用同一套表结构
+        crawler.sqlite_db.connect()
 
         print(f"\n{Fore.CYAN}开始获取评论...{Style.RESET_ALL}")
         print_success_message()
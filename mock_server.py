@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""本地模拟微博接口的服务器
+
+回放transport.mode为record时录制的接口响应，用于离线运行爬虫、调试和测量性能。
+config.json中把transport.mode设为replay后，weibo.py、get_single_weibo_comments.py
+和danmu_server.py发往m.weibo.cn/weibo.com的请求都会被改写到这里。
+
+用法：
+    python mock_server.py --fixture-dir fixtures --port 8765 --latency 200 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+from urllib.parse import parse_qsl, urlencode
+
+from aiohttp import web
+
+from util.transport import FixtureArchive
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 模拟被限流时返回的内容
+THROTTLED_BODY = json.dumps({"ok": 0, "msg": "请求过于频繁"}, ensure_ascii=False)
+CAPTCHA_BODY = json.dumps({"ok": -100, "url": "https://passport.weibo.com/visitor/visitor"})
+
+
+class MockWeibo:
+    """按录制的响应回答请求，并可注入延迟和错误"""
+
+    def __init__(self, fixture_dir, latency=0, jitter=0, error_rate=0, error_status=418, captcha_rate=0):
+        self.fixtures = FixtureArchive(fixture_dir).load()
+        # 按host/path分组，参数不完全一致时退而使用同一接口参数最接近的响应
+        self.paths = {}
+        for key, fixture in self.fixtures.items():
+            path, _, query = key.partition("?")
+            self.paths.setdefault(path, []).append((set(parse_qsl(query)), fixture))
+        self.latency = latency / 1000.0
+        self.jitter = jitter / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.captcha_rate = captcha_rate
+        self.stats = {"exact": 0, "fallback": 0, "missing": 0, "error": 0, "captcha": 0}
+        logger.info(f"已加载{len(self.fixtures)}个录制的响应，共{len(self.paths)}个接口")
+
+    def find(self, path, query):
+        """查找请求对应的响应，先精确匹配，再按接口路径匹配"""
+        key = path
+        if query:
+            key += "?" + urlencode(sorted(query))
+        fixture = self.fixtures.get(key)
+        if fixture:
+            self.stats["exact"] += 1
+            return fixture
+        candidates = self.paths.get(path)
+        if not candidates:
+            self.stats["missing"] += 1
+            return None
+        self.stats["fallback"] += 1
+        query = set(query)
+        return max(candidates, key=lambda c: len(c[0] & query))[1]
+
+    async def handle(self, request):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats["error"] += 1
+            return web.Response(
+                text=THROTTLED_BODY, status=self.error_status, content_type="application/json"
+            )
+        if self.captcha_rate and random.random() < self.captcha_rate:
+            self.stats["captcha"] += 1
+            return web.Response(text=CAPTCHA_BODY, content_type="application/json")
+        path = request.match_info["host"] + "/" + request.match_info["path"]
+        fixture = self.find(path, list(request.query.items()))
+        if fixture is None:
+            logger.warning(f"没有录制的响应: {request.path_qs}")
+            return web.Response(
+                text=json.dumps({"ok": 0, "msg": "no fixture"}), status=404, content_type="application/json"
+            )
+        content_type = (fixture.get("content_type") or "text/plain").split(";")[0]
+        return web.Response(text=fixture["body"], status=fixture["status"], content_type=content_type)
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats)
+
+
+def init_app(mock):
+    app = web.Application()
+    app.router.add_get('/_stats', mock.handle_stats)
+    # 路径形如 /m.weibo.cn/api/container/getIndex、/weibo.com/ajax/statuses/buildComments
+    app.router.add_get('/{host}/{path:.*}', mock.handle)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的微博接口响应")
+    parser.add_argument("--fixture-dir", default="fixtures", help="录制的响应所在目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="每个请求固定延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="在固定延迟上额外增加的随机延迟上限（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回限流错误的概率")
+    parser.add_argument("--error-status", type=int, default=418, help="限流错误使用的状态码")
+    parser.add_argument("--captcha-rate", type=float, default=0, help="返回需要验证码的概率")
+    args = parser.parse_args()
+    mock = MockWeibo(
+        args.fixture_dir,
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.error_status,
+        args.captcha_rate,
+    )
+    web.run_app(init_app(mock), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Weibo.cut_known_cards的自检：append模式下同时启用high_water和seen_ids时，
+遇到上次运行的最新微博应当停止翻页，而不是跳过已写入的微博继续抓取。
+用法：python test_cut_known_cards.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+
+import const
+from util.seen_ids import SeenIds
+from weibo import Weibo
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def make_card(weibo_id, is_top=False):
+    mblog = {"id": str(weibo_id)}
+    if is_top:
+        mblog["isTop"] = 1
+    return {"card_type": 9, "mblog": mblog}
+
+
+def card_ids(cards):
+    return [int(card["mblog"]["id"]) for card in cards]
+
+
+def make_weibo(high_water_id, seen_ids):
+    """只设置cut_known_cards用到的属性，不读取配置、不发出请求"""
+    wb = Weibo.__new__(Weibo)
+    wb.weibo_ids = set()
+    wb.high_water_id = high_water_id
+    wb.seen_ids = seen_ids
+    return wb
+
+
+def cut(cards, high_water_id, written_ids, page=2):
+    mode = const.MODE
+    const.MODE = "append"
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            seen_ids = None
+            if written_ids is not None:
+                seen_ids = SeenIds(os.path.join(tmp_dir, "seen_ids.bin"))
+                for weibo_id in written_ids:
+                    seen_ids.add(weibo_id)
+            new_cards, reached_known = make_weibo(high_water_id, seen_ids).cut_known_cards(cards, page)
+            if seen_ids is not None:
+                seen_ids.close()
+            return card_ids(new_cards), reached_known
+    finally:
+        const.MODE = mode
+
+
+def test_stops_at_high_water_with_seen_ids():
+    cards = [make_card(i) for i in (120, 110, 100, 90)]
+    # 上次运行写入了100及更早的微博，seen_ids中也有这些id
+    assert cut(cards, 100, [100, 90, 80]) == ([120, 110], True)
+    assert cut(cards, 100, None) == ([120, 110], True)
+
+
+def test_seen_pinned_weibo_is_skipped():
+    # 置顶微博比high_water旧时只跳过，不作为结束的标志
+    cards = [make_card(50, is_top=True), make_card(120), make_card(110)]
+    assert cut(cards, 100, [50], page=1) == ([120, 110], False)
+    # 比high_water新、但已在以前的运行中写入的微博（如上次中断的运行）按seen_ids跳过
+    cards = [make_card(130), make_card(120), make_card(110)]
+    assert cut(cards, 100, [120]) == ([130, 110], False)
+
+
+def main():
+    failed = 0
+    for test in (test_stops_at_high_water_with_seen_ids, test_seen_pinned_weibo_is_skipped):
+        try:
+            test()
+            logger.info("%s 通过", test.__name__)
+        except AssertionError:
+            failed += 1
+            logger.exception("%s 失败", test.__name__)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
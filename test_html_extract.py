@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""util.html_extract的差分自检
+
+随机生成正文和评论，把parse_entities（纯文本快速路径和一次遍历的extract_entities）的结果
+与改写前分别执行的五个XPath（//text()、string(.)、//span、//span[@class='surl-text']、//a）
+逐字段比较，有不一致时以非零状态退出。
+用法：python test_html_extract.py [随机种子] [条数]
+"""
+
+import logging
+import random
+import sys
+import time
+
+from lxml import etree
+
+from util.html_extract import (
+    LOCATION_ICON,
+    TAG_PATTERN,
+    WeiboEntities,
+    is_plain_text,
+    parse_entities,
+    strip_tags,
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PIECES = [
+    "微博", "hello", " ", "  ", "\n", "\t", "\f", "\x0b", "\u3000", "\xa0",
+    "<br />", "<br/>", "<br>", "<BR>", "<br / >", "</br>", "a > b", "1 < 2", "<",
+    ">", "&amp;", "&lt;", "&", "\r", "\x00", "😀", "#话题", "@某人",
+    '<span class="url-icon"><img alt="[笑]" src="https://h5.sinaimg.cn/m/emoticon/icon/default/d_xiaoku.png" /></span>',
+    '<a href="/n/某人">@某人</a>',
+    '<a href="https://m.weibo.cn/search?containerid=1"><span class="surl-text">#话题#</span></a>',
+    '<a data-url="http://t.cn/abc" href="https://weibo.com"><span class="surl-text">网页链接</span></a>',
+    "发布了头条文章", "<!-- c -->",
+    '<a data-url="http://t.cn/A6loc" href="https://m.weibo.cn/p/index?containerid=1"><span class=\'url-icon\'>'
+    '<img src=\'https://h5.sinaimg.cn/upload/2015/09/25/3/timeline_card_small_location_default.png\'></span>'
+    '<span class="surl-text">北京·朝阳</span></a>',
+    '<a data-url="http://t.cn/A6abc" href="https://weibo.com/ttarticle/p/show?id=1"><span class="url-icon">'
+    '<img src="https://h5.sinaimg.cn/upload/2015/09/25/3/timeline_card_small_article_default.png"></span>'
+    '<span class="surl-text">文章标题</span></a>',
+    '<a href="/n/李四">@李四 </a>', '<span class="surl-text">##</span>', '<span class="surl-text x">#b#</span>',
+    '<span><span>嵌套</span></span>', '<b>粗<i>斜</i>体</b>', '<a href="/n/x">x</a>',
+]
+
+
+class XPathEntities:
+    """改写前的提取方式：对整棵树分别执行XPath，作为比较的基准"""
+
+    def __init__(self, selector):
+        self.text_list = [str(text) for text in selector.xpath("//text()")]
+        self.text = selector.xpath("string(.)")
+        self.article_url = self.get_article_url(selector)
+        self.location = self.get_location(selector)
+        self.topics = self.get_topics(selector)
+        self.at_users = self.get_at_users(selector)
+
+    def get_article_url(self, selector):
+        url = ""
+        if self.text.startswith("发布了头条文章"):
+            urls = selector.xpath("//a/@data-url")
+            if urls and urls[0].startswith("http://t.cn"):
+                url = urls[0]
+        return url
+
+    @staticmethod
+    def get_location(selector):
+        location = ""
+        span_list = selector.xpath("//span")
+        for i, span in enumerate(span_list):
+            if span.xpath("img/@src"):
+                if LOCATION_ICON in span.xpath("img/@src")[0]:
+                    location = span_list[i + 1].xpath("string(.)")
+                    break
+        return location
+
+    @staticmethod
+    def get_topics(selector):
+        topic_list = []
+        for span in selector.xpath("//span[@class='surl-text']"):
+            text = span.xpath("string(.)")
+            if len(text) > 2 and text[0] == "#" and text[-1] == "#":
+                topic_list.append(text[1:-1])
+        return ",".join(topic_list)
+
+    @staticmethod
+    def get_at_users(selector):
+        at_list = []
+        for a in selector.xpath("//a"):
+            if "@" + a.xpath("@href")[0][3:] == a.xpath("string(.)"):
+                at_list.append(a.xpath("string(.)")[1:])
+        return ",".join(at_list)
+
+
+def slow(text_body):
+    """改写前的解析方式：整段正文交给lxml，再分别执行XPath"""
+    selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
+    return None if selector is None else XPathEntities(selector)
+
+
+def build_corpus(seed=0, count=20000):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        pieces = PIECES if rng.random() < 0.3 else PIECES[:20]
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 12)))
+        try:
+            reference = slow(text)
+        except IndexError:
+            # 位置图标后没有span、a没有href时原来的XPath直接抛出异常，没有可以比较的结果
+            continue
+        if reference is not None:
+            # lxml无法解析的正文（如只有注释）原来的方式同样无法处理，不参与比较
+            corpus.append(text)
+    return corpus
+
+
+def find_mismatches(corpus):
+    """返回 (正文, 字段名) 的列表，字段名为strip_tags代表评论去标签的结果不一致"""
+    mismatches = []
+    for text in corpus:
+        fast_result = parse_entities(text)
+        slow_result = slow(text)
+        for name in WeiboEntities.__slots__:
+            if getattr(fast_result, name) != getattr(slow_result, name):
+                mismatches.append((text, name))
+        if strip_tags(text) != TAG_PATTERN.sub("", text):
+            mismatches.append((text, "strip_tags"))
+    return mismatches
+
+
+def test_parse_entities_matches_lxml():
+    assert find_mismatches(build_corpus()) == []
+
+
+def main():
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    corpus = build_corpus(seed, count)
+    mismatches = find_mismatches(corpus)
+    for text, name in mismatches[:20]:
+        logger.error("字段%s与lxml解析结果不一致，正文：%r", name, text)
+    if mismatches:
+        logger.error("%d条正文中有%d处结果不一致", len(corpus), len(mismatches))
+        sys.exit(1)
+
+    plain_corpus = [text for text in corpus if is_plain_text(text)]
+    logger.info("%d条正文结果一致，其中%d条走纯文本路径", len(corpus), len(plain_corpus))
+    for name, func in (("lxml", slow), ("快速路径", parse_entities)):
+        start = time.perf_counter()
+        for text in plain_corpus:
+            func(text)
+        logger.info("%s解析%d条纯文本正文用时%.3f秒", name, len(plain_corpus), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from util.quarantine import CrawlBlocked
+from util.ratelimit import classify_response, get_endpoint
+
+logger = logging.getLogger(__name__)
+
+INDEX_URL = "https://m.weibo.cn/api/container/getIndex"
+
+
+class AsyncCrawler:
+    """基于asyncio的多用户并发抓取引擎
+
+    用户信息和微博列表的请求通过aiohttp并发发出，同时抓取的用户数由concurrency限制；
+    解析和写入仍然走Weibo原有的parse_one_page/write_data流程，统一放在一个写入线程中
+    串行执行，避免多个用户同时写同一个文件或数据库。
+    长微博全文、评论和转发仍由写入线程通过requests同步请求（长微博全文可由预取线程提前获取），
+    这些请求期间其他用户的解析和写入需要等待，只有用户信息和微博列表是并发获取的。
+    """
+
+    def __init__(self, wb, concurrency):
+        self.wb = wb
+        self.concurrency = max(1, int(concurrency))
+
+    def run(self):
+        """运行并发抓取，直到所有用户抓取完毕"""
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=10)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.executor = executor
+            headers = {k: v for k, v in self.wb.headers.items() if v}
+            async with aiohttp.ClientSession(
+                headers=headers, timeout=timeout
+            ) as session:
+                self.session = session
+                logger.info(
+                    "使用异步并发模式抓取%d个用户，并发数为%d",
+                    len(self.wb.user_config_list),
+                    self.concurrency,
+                )
+                await asyncio.gather(
+                    *[
+                        self.crawl_user(user_config)
+                        for user_config in self.wb.user_config_list
+                    ]
+                )
+                await self.retry_quarantined()
+                await self.call(self.wb.export_user_state)
+                await self.call(self.wb.close)
+
+    async def call(self, func, *args):
+        """在写入线程中执行同步的解析或写入函数"""
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def get_json(self, params, max_retries=3):
+        """异步请求getIndex接口，并把响应类别反馈给限速器，失败时返回空字典"""
+        params = {k: v for k, v in params.items() if v is not None}
+        http_cache = self.wb.http_cache
+        headers = {k: v for k, v in self.wb.get_headers().items() if v}
+        if http_cache:
+            cached = http_cache.get(INDEX_URL, params, headers.get("Cookie"))
+            if cached is not None:
+                return json.loads(cached)
+        endpoint = get_endpoint(INDEX_URL)
+        transport = self.wb.transport
+        url = transport.rewrite(INDEX_URL) if transport else INDEX_URL
+        for retry in range(max_retries):
+            if retry:
+                headers = {k: v for k, v in self.wb.get_headers().items() if v}
+            cookie = headers.get("Cookie")
+            await self.wb.rate_limiter.acquire_async(endpoint, cookie)
+            status_code = None
+            js = None
+            try:
+                async with self.session.get(
+                    url, params=params, headers=headers, ssl=False
+                ) as response:
+                    status_code = response.status
+                    text = await response.text()
+                    if transport:
+                        transport.record(
+                            INDEX_URL,
+                            status_code,
+                            response.headers.get("Content-Type", ""),
+                            text,
+                            params,
+                        )
+                    js = json.loads(text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"请求失败，错误信息：{e}")
+            except ValueError as ve:
+                logger.error(f"JSON 解码失败，错误信息：{ve}")
+            signal = classify_response(status_code, js)
+            self.wb.report_signal(INDEX_URL, cookie, signal)
+            if signal == "ok":
+                if http_cache:
+                    http_cache.set(INDEX_URL, params, text, cookie)
+                return js
+            if signal == "captcha" and not self.wb.cookie_pool.has_available():
+                raise CrawlBlocked("验证码", js.get("url"), params.get("page"))
+            logger.warning(f"请求{params.get('containerid')}失败（{signal}），降低请求速率后重试...")
+        return {}
+
+    async def crawl_user(self, user_config):
+        """抓取一个用户（及其全部query）的微博"""
+        async with self.semaphore:
+            worker = None
+            for query in user_config["query_list"] or [""]:
+                worker = self.wb.fork(user_config, query)
+                await self.crawl_query(worker)
+            logger.info("信息抓取完毕")
+            logger.info("*" * 100)
+            if self.wb.user_config_file_path and worker.user:
+                await self.call(worker.record_since_date)
+
+    async def crawl_query(self, worker, page=None, got_count=0):
+        """抓取一个用户的一个query，被验证码阻断时放入隔离区并返回False
+
+        page为None时从上次运行的抓取进度继续。
+        """
+        if page is None:
+            page, got_count = await self.call(worker.load_checkpoint)
+        worker.got_count = got_count
+        try:
+            await self.crawl_pages(worker, page)
+            return True
+        except CrawlBlocked as e:
+            self.wb.quarantine.add(
+                worker.user_config,
+                worker.query,
+                e.page or page,
+                worker.got_count,
+                e.reason,
+                e.captcha_url,
+            )
+            return False
+
+    async def retry_quarantined(self):
+        """等待并并发重试隔离区中的任务，直到隔离区为空"""
+        quarantine = self.wb.quarantine
+        while len(quarantine):
+            logger.info("隔离区中还有%d个任务，等待重试...", len(quarantine))
+            items, resolved = await self.loop.run_in_executor(None, quarantine.wait)
+            if resolved:
+                self.wb.on_captcha_resolved()
+            await asyncio.gather(*[self.retry_item(item) for item in items])
+
+    async def retry_item(self, item):
+        async with self.semaphore:
+            logger.info("重试用户 %s，从第%d页继续", item.user_config["user_id"], item.page)
+            worker = self.wb.fork(item.user_config, item.query)
+            if await self.crawl_query(worker, item.page, item.got_count):
+                if self.wb.user_config_file_path and worker.user:
+                    await self.call(worker.record_since_date)
+
+    async def crawl_pages(self, worker, start_page=1):
+        """抓取一个用户的用户信息和微博列表"""
+        user_id = worker.user_config["user_id"]
+        try:
+            js = await self.get_json({"containerid": "100505" + str(user_id)})
+            if not js:
+                raise CrawlBlocked("持续限流")
+            data = js.get("data")
+            info = data.get("userInfo") if isinstance(data, dict) else None
+            if not info:
+                logger.warning("未能获取到用户 %s 的信息，请确认user_id是否正确。", user_id)
+                return
+            info_js = await self.get_json(worker.get_user_info_params())
+            worker.user = await self.call(worker.build_user_info, info, info_js)
+            await self.call(worker.user_to_database)
+            logger.info(f"成功获取到用户 {user_id} 的信息。")
+            if await self.call(worker.begin_pages):
+                page = start_page
+                is_end = False
+                try:
+                    while not is_end and worker.got_count < worker.max_weibo_count:
+                        js = await self.get_json(worker.get_weibo_params(page))
+                        if not js:
+                            # 与用户信息一样放入隔离区，不能当作没有更多微博而标记抓取完毕
+                            raise CrawlBlocked("持续限流", page=page)
+                        is_end = await self.call(worker.parse_one_page, js, page)
+                        await self.call(worker.flush_page, page)
+                        page += 1
+                    await self.call(worker.finish_checkpoint)
+                finally:
+                    await self.call(worker.write_data, 0)
+            logger.info("微博爬取完成，共爬取%d条微博", worker.got_count)
+        except CrawlBlocked:
+            raise
+        except Exception as e:
+            logger.exception(e)
@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from util.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class ContentCache:
+    """被转发原微博的缓存，以微博id为键保存解析后的微博（含长微博全文）
+
+    同一条热门微博被多个用户转发时只需请求、解析一次。内存中按LRU淘汰；
+    指定path时额外保存到SQLite，多次运行之间共享，超过ttl秒的内容视为过期。
+    """
+
+    def __init__(self, memory_size=2000, path=None, ttl=86400):
+        self.memory = LRUCache(memory_size)
+        self.ttl = ttl
+        self.con = None
+        self.lock = threading.Lock()
+        if path:
+            cache_dir = os.path.dirname(path)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            self.con = sqlite3.connect(path, check_same_thread=False)
+            self.con.execute(
+                """CREATE TABLE IF NOT EXISTS content_cache (
+                    id varchar(20) NOT NULL
+                    ,body text
+                    ,updated_at real
+                    ,PRIMARY KEY (id)
+                )"""
+            )
+            self.con.commit()
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def get(self, id):
+        """获取缓存的微博，返回副本，没有或已过期时返回None"""
+        id = str(id)
+        body = self.memory.get(id)
+        if body is None and self.con is not None:
+            with self.lock:
+                row = self.con.execute(
+                    "SELECT body, updated_at FROM content_cache WHERE id=?", (id,)
+                ).fetchone()
+            if row and (self.ttl <= 0 or time.time() - row[1] < self.ttl):
+                body = row[0]
+                self.memory.set(id, body)
+        if body is None:
+            return None
+        return json.loads(body, object_pairs_hook=OrderedDict)
+
+    def set(self, id, weibo):
+        """缓存解析后的微博"""
+        id = str(id)
+        body = json.dumps(weibo, ensure_ascii=False)
+        self.memory.set(id, body)
+        if self.con is not None:
+            with self.lock:
+                self.con.execute(
+                    "INSERT OR REPLACE INTO content_cache(id, body, updated_at) VALUES(?, ?, ?)",
+                    (id, body, time.time()),
+                )
+                self.con.commit()
@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# cookie池的默认参数，可在config.json的cookie_pool中覆盖
+DEFAULT_POOL_CONFIG = {
+    "park_seconds": 300,  # 被限流后暂停使用该cookie的秒数，连续被限流时成倍增加
+    "captcha_park_seconds": 1800,  # 出现验证码后暂停使用该cookie的秒数
+    "max_park_seconds": 3600,
+    "hourly_quota": 0,  # 每个cookie每小时最多请求次数，0代表不限制
+    "health_band": 0.2,  # 健康分与最高分相差在此范围内的cookie轮流使用
+}
+
+# 使cookie被暂停使用的响应类别
+PARK_SIGNALS = ("captcha", "throttled")
+# 计入失败的响应类别
+FAILURE_SIGNALS = ("empty", "captcha", "throttled", "decode_error", "error")
+
+
+def get_config_cookies(config):
+    """读取config.json中的全部cookie，cookie放在cookie_pool.cookies之前"""
+    cookies = list((config.get("cookie_pool") or {}).get("cookies") or [])
+    if config.get("cookie"):
+        cookies.insert(0, config["cookie"])
+    return cookies
+
+
+class CookieState:
+    """单个cookie的使用情况"""
+
+    def __init__(self, cookie):
+        self.cookie = cookie
+        self.success = 0
+        self.failure = 0
+        self.captcha_count = 0
+        self.consecutive_throttles = 0
+        self.last_throttled = 0
+        self.parked_until = 0
+        self.last_used = 0
+        self.recent = deque()  # 最近一小时内的请求时间，用于限制配额
+
+    @property
+    def score(self):
+        """健康分，取值0~1：平滑后的成功率，每次验证码再额外扣分"""
+        rate = (self.success + 1.0) / (self.success + self.failure + 2.0)
+        return rate / (1 + self.captcha_count)
+
+    def used_in_last_hour(self, now):
+        while self.recent and now - self.recent[0] > 3600:
+            self.recent.popleft()
+        return len(self.recent)
+
+
+class CookiePool:
+    """多账号cookie池
+
+    每次请求从健康的cookie中轮流选出一个使用，统计每个cookie的成功率、验证码次数和
+    最近被限流的时间；被限流或出现验证码的cookie暂停使用一段时间，其余cookie继续抓取。
+    配合RateLimiter按cookie划分的令牌桶，整体请求速率随cookie数量线性增加。
+    """
+
+    def __init__(self, cookies, pool_config=None):
+        self.config = dict(DEFAULT_POOL_CONFIG)
+        if pool_config:
+            self.config.update(
+                {k: v for k, v in pool_config.items() if k in DEFAULT_POOL_CONFIG}
+            )
+        self.states = [CookieState(c) for c in dict.fromkeys(c for c in cookies if c)]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据config.json创建cookie池，兼容只填写了cookie的旧配置"""
+        return cls(get_config_cookies(config), config.get("cookie_pool"))
+
+    def __len__(self):
+        return len(self.states)
+
+    def get_state(self, cookie):
+        for state in self.states:
+            if state.cookie == cookie:
+                return state
+        return None
+
+    def available(self, now=None):
+        """当前未被暂停且未超过配额的cookie"""
+        now = now or time.time()
+        quota = self.config["hourly_quota"]
+        return [
+            s
+            for s in self.states
+            if s.parked_until <= now
+            and (not quota or s.used_in_last_hour(now) < quota)
+        ]
+
+    def pick(self):
+        """选出本次请求使用的cookie，cookie池为空时返回None
+
+        健康分接近最高分的cookie轮流使用；全部被暂停时使用最早恢复的cookie，
+        此时请求间隔由该cookie已经降速的令牌桶保证。
+        """
+        if not self.states:
+            return None
+        now = time.time()
+        with self.lock:
+            candidates = self.available(now)
+            if candidates:
+                best = max(s.score for s in candidates)
+                candidates = [
+                    s for s in candidates if s.score >= best - self.config["health_band"]
+                ]
+                state = min(candidates, key=lambda s: s.last_used)
+            else:
+                state = min(self.states, key=lambda s: s.parked_until)
+            state.last_used = now
+            state.recent.append(now)
+            return state.cookie
+
+    def has_available(self):
+        """是否还有未被暂停的cookie"""
+        with self.lock:
+            return bool(self.available())
+
+    def report(self, cookie, signal):
+        """记录请求结果，被限流或出现验证码时暂停使用该cookie"""
+        with self.lock:
+            state = self.get_state(cookie)
+            if state is None:
+                return
+            if signal == "ok":
+                state.success += 1
+                state.consecutive_throttles = 0
+                return
+            if signal not in FAILURE_SIGNALS:
+                return
+            state.failure += 1
+            if signal not in PARK_SIGNALS:
+                return
+            now = time.time()
+            state.last_throttled = now
+            state.consecutive_throttles += 1
+            if signal == "captcha":
+                state.captcha_count += 1
+                seconds = self.config["captcha_park_seconds"]
+            else:
+                seconds = self.config["park_seconds"] * 2 ** (state.consecutive_throttles - 1)
+            seconds = min(seconds, self.config["max_park_seconds"])
+            state.parked_until = max(state.parked_until, now + seconds)
+            logger.warning(
+                "第%d个cookie返回%s，暂停使用%d秒，当前健康分%.2f",
+                self.states.index(state) + 1,
+                signal,
+                seconds,
+                state.score,
+            )
+
+    def reload(self, cookies):
+        """验证码处理后调用：加入新的cookie，并恢复所有被暂停的cookie"""
+        with self.lock:
+            known = {s.cookie for s in self.states}
+            for cookie in cookies:
+                if cookie and cookie not in known:
+                    self.states.append(CookieState(cookie))
+                    known.add(cookie)
+            for state in self.states:
+                state.parked_until = 0
+                state.consecutive_throttles = 0
+
+    def stats(self):
+        """各cookie的统计信息，用于日志输出"""
+        now = time.time()
+        with self.lock:
+            return [
+                {
+                    "index": i + 1,
+                    "success": s.success,
+                    "failure": s.failure,
+                    "captcha_count": s.captcha_count,
+                    "score": round(s.score, 3),
+                    "parked": s.parked_until > now,
+                    "last_throttled": (
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s.last_throttled))
+                        if s.last_throttled
+                        else ""
+                    ),
+                }
+                for i, s in enumerate(self.states)
+            ]
+
+    def log_stats(self):
+        """抓取结束时输出各cookie的健康情况"""
+        for stat in self.stats():
+            logger.info(
+                "第%d个cookie：成功%d次，失败%d次，验证码%d次，健康分%.2f%s%s",
+                stat["index"],
+                stat["success"],
+                stat["failure"],
+                stat["captcha_count"],
+                stat["score"],
+                "，最近一次被限流于" + stat["last_throttled"] if stat["last_throttled"] else "",
+                "，仍在暂停中" if stat["parked"] else "",
+            )
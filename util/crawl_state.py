@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# 某个用户已经获取到的最新微博，append模式遇到不比它新的微博时停止抓取
+HighWater = namedtuple("HighWater", ["newest_id", "newest_created_at"])
+
+# 某个用户某个query的抓取进度
+# page为最后一个已写入的页码，cursor为已写入微博中最旧的微博id，newest_id为最新的微博id，
+# newest_created_at为最新微博的发布时间
+Checkpoint = namedtuple(
+    "Checkpoint", ["page", "cursor", "newest_id", "newest_created_at", "got_count", "finished"]
+)
+
+
+class CrawlState:
+    """抓取进度的持久化存储
+
+    每写完一页就记录该用户、该query的页码和位置，程序崩溃、被中断或被验证码阻断后，
+    下次运行时从上次写完的页继续，不需要手动修改start_page。
+    每个用户完整抓取一次后记录其最新微博的id和发布时间，供append模式增量抓取。
+    用户信息和写回user_id.txt的起始时间也按用户id保存在这里，运行结束时一次性导出。
+    path为":memory:"时只在本次运行中保存。
+    """
+
+    def __init__(self, path):
+        state_dir = os.path.dirname(path) if path != ":memory:" else ""
+        if state_dir and not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoint (
+                user_id varchar(20) NOT NULL
+                ,query varchar(100) NOT NULL
+                ,page integer
+                ,cursor integer
+                ,newest_id integer
+                ,newest_created_at varchar(20)
+                ,got_count integer
+                ,finished integer
+                ,updated_at real
+                ,PRIMARY KEY (user_id, query)
+            )"""
+        )
+        # 旧版本创建的checkpoint表没有newest_created_at列
+        columns = {row[1] for row in self.con.execute("PRAGMA table_info(checkpoint)")}
+        if "newest_created_at" not in columns:
+            self.con.execute("ALTER TABLE checkpoint ADD COLUMN newest_created_at varchar(20)")
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS high_water (
+                user_id varchar(20) NOT NULL
+                ,newest_id integer
+                ,newest_created_at varchar(20)
+                ,updated_at real
+                ,PRIMARY KEY (user_id)
+            )"""
+        )
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS user_state (
+                user_id varchar(20) NOT NULL
+                ,screen_name varchar(30)
+                ,user_info text
+                ,since_date varchar(20)
+                ,config_pending integer DEFAULT 0
+                ,updated_at real
+                ,PRIMARY KEY (user_id)
+            )"""
+        )
+        self.con.commit()
+
+    def get_checkpoint(self, user_id, query=""):
+        """获取抓取进度，没有记录时返回None"""
+        with self.lock:
+            row = self.con.execute(
+                "SELECT page, cursor, newest_id, newest_created_at, got_count, finished FROM checkpoint"
+                " WHERE user_id=? AND query=?",
+                (str(user_id), query),
+            ).fetchone()
+        return Checkpoint(*row) if row else None
+
+    def save_checkpoint(
+        self, user_id, query, page, cursor, newest_id, newest_created_at, got_count
+    ):
+        """记录一页已经写入完毕"""
+        with self.lock:
+            self.con.execute(
+                "INSERT OR REPLACE INTO checkpoint(user_id, query, page, cursor, newest_id,"
+                " newest_created_at, got_count, finished, updated_at)"
+                " VALUES(?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (
+                    str(user_id),
+                    query,
+                    page,
+                    cursor,
+                    newest_id,
+                    newest_created_at,
+                    got_count,
+                    time.time(),
+                ),
+            )
+            self.con.commit()
+
+    def finish_checkpoint(self, user_id, query=""):
+        """标记该用户、该query已经完整抓取，下次运行重新从第一页开始"""
+        with self.lock:
+            self.con.execute(
+                "UPDATE checkpoint SET finished=1, updated_at=? WHERE user_id=? AND query=?",
+                (time.time(), str(user_id), query),
+            )
+            self.con.commit()
+
+    def get_high_water(self, user_id):
+        """获取用户已经获取到的最新微博，没有记录时返回None"""
+        with self.lock:
+            row = self.con.execute(
+                "SELECT newest_id, newest_created_at FROM high_water WHERE user_id=?",
+                (str(user_id),),
+            ).fetchone()
+        return HighWater(*row) if row else None
+
+    def update_high_water(self, user_id, newest_id, newest_created_at=None):
+        """记录用户的最新微博，只有比已记录的更新时才会覆盖"""
+        user_id = str(user_id)
+        with self.lock:
+            row = self.con.execute(
+                "SELECT newest_id, newest_created_at FROM high_water WHERE user_id=?",
+                (user_id,),
+            ).fetchone()
+            if row and row[0] is not None and row[0] >= newest_id:
+                return
+            if newest_created_at is None and row:
+                newest_created_at = row[1]
+            self.con.execute(
+                "INSERT OR REPLACE INTO high_water(user_id, newest_id, newest_created_at,"
+                " updated_at) VALUES(?, ?, ?, ?)",
+                (user_id, newest_id, newest_created_at, time.time()),
+            )
+            self.con.commit()
+
+    def save_user(self, user_id, screen_name, user_info):
+        """保存用户信息，user_info为可以转为json的字典"""
+        user_id = str(user_id)
+        body = json.dumps(user_info, ensure_ascii=False)
+        with self.lock:
+            # 已有的用户只更新信息，保留插入顺序和since_date
+            self.con.execute(
+                "INSERT OR IGNORE INTO user_state(user_id) VALUES(?)", (user_id,)
+            )
+            self.con.execute(
+                "UPDATE user_state SET screen_name=?, user_info=?, updated_at=? WHERE user_id=?",
+                (screen_name, body, time.time(), user_id),
+            )
+            self.con.commit()
+
+    def count_users(self):
+        with self.lock:
+            return self.con.execute("SELECT COUNT(*) FROM user_state").fetchone()[0]
+
+    def get_users(self):
+        """按首次保存的顺序返回全部用户的 (用户信息字典, 最新微博)，最新微博没有记录时为None"""
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT u.user_info, h.newest_id, h.newest_created_at FROM user_state u"
+                " LEFT JOIN high_water h ON h.user_id = u.user_id"
+                " WHERE u.user_info IS NOT NULL ORDER BY u.rowid"
+            ).fetchall()
+        return [
+            (json.loads(info), HighWater(newest_id, created_at) if newest_id else None)
+            for info, newest_id, created_at in rows
+        ]
+
+    def set_since_date(self, user_id, screen_name, since_date):
+        """记录用户下次运行的起始时间，等待写回用户配置文件"""
+        user_id = str(user_id)
+        with self.lock:
+            self.con.execute(
+                "INSERT OR IGNORE INTO user_state(user_id) VALUES(?)", (user_id,)
+            )
+            self.con.execute(
+                "UPDATE user_state SET screen_name=COALESCE(screen_name, ?), since_date=?,"
+                " config_pending=1, updated_at=? WHERE user_id=?",
+                (screen_name, since_date, time.time(), user_id),
+            )
+            self.con.commit()
+
+    def get_pending_since_dates(self):
+        """返回还没有写回用户配置文件的 {用户id: (昵称, 起始时间)}"""
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT user_id, screen_name, since_date FROM user_state WHERE config_pending=1"
+            ).fetchall()
+        return {user_id: (screen_name, since_date) for user_id, screen_name, since_date in rows}
+
+    def clear_pending_since_dates(self, user_ids):
+        with self.lock:
+            self.con.executemany(
+                "UPDATE user_state SET config_pending=0 WHERE user_id=?",
+                [(user_id,) for user_id in user_ids],
+            )
+            self.con.commit()
+
+    def close(self):
+        with self.lock:
+            self.con.close()
@@ -1,5 +1,7 @@
 
 import datetime
+import re
+from functools import lru_cache
 
 
 # def convert_to_days_ago(date_str, how_many_days):
@@ -13,3 +15,68 @@ def convert_to_days_ago(date_str, how_many_days):
     date_str = datetime.datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S')
     date_str = date_str + datetime.timedelta(days=-how_many_days)
     return date_str.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+# 微博使用的标准时间格式
+DTFORMAT = '%Y-%m-%dT%H:%M:%S'
+FULL_DTFORMAT = '%Y-%m-%d %H:%M:%S'
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+# 接口返回的绝对时间，如 Tue Jun 10 12:49:00 +0800 2025，与语言区域设置无关
+WEIBO_DATE_PATTERN = re.compile(
+    r'^[A-Za-z]{3} ([A-Za-z]{3}) +(\d{1,2}) (\d{1,2}):(\d{2}):(\d{2}) (?:[+-]\d{4} )?(\d{4})$'
+)
+
+
+@lru_cache(maxsize=4096)
+def parse_absolute_date(created_at):
+    """解析接口返回的绝对时间，忽略时区，结果按原字符串缓存"""
+    match = WEIBO_DATE_PATTERN.match(created_at.strip())
+    if not match or match.group(1) not in MONTHS:
+        raise ValueError('无法解析的微博时间：{}'.format(created_at))
+    month, day, hour, minute, second, year = match.groups()
+    return datetime.datetime(
+        int(year), MONTHS[month], int(day), int(hour), int(minute), int(second)
+    )
+
+
+def parse_weibo_date(created_at, now=None):
+    """把微博时间（刚刚、x分钟前、x小时前、昨天或绝对时间）解析为datetime
+
+    相对时间以now为基准，同一页的微博应传入同一个now；now为None时使用当前时间。
+    """
+    if '刚刚' in created_at:
+        return now or datetime.datetime.now()
+    if '分钟' in created_at:
+        minutes = int(created_at[: created_at.find('分钟')])
+        return (now or datetime.datetime.now()) - datetime.timedelta(minutes=minutes)
+    if '小时' in created_at:
+        hours = int(created_at[: created_at.find('小时')])
+        return (now or datetime.datetime.now()) - datetime.timedelta(hours=hours)
+    if '昨天' in created_at:
+        return (now or datetime.datetime.now()) - datetime.timedelta(days=1)
+    return parse_absolute_date(created_at)
+
+
+@lru_cache(maxsize=4096)
+def format_absolute_date(created_at):
+    ts = parse_absolute_date(created_at)
+    return ts.strftime(DTFORMAT), ts.strftime(FULL_DTFORMAT)
+
+
+def standardize_date(created_at, now=None):
+    """标准化微博发布时间，返回 (yyyy-mm-ddThh:mm:ss, yyyy-mm-dd hh:mm:ss)"""
+    for word in ('刚刚', '分钟', '小时', '昨天'):
+        if word in created_at:
+            ts = parse_weibo_date(created_at, now)
+            return ts.strftime(DTFORMAT), ts.strftime(FULL_DTFORMAT)
+    return format_absolute_date(created_at)
+
+
+@lru_cache(maxsize=256)
+def normalize_datetime(date_str):
+    """把yyyy-mm-ddThh:mm:ss形式的时间（可不补零）规范为补零后的字符串，规范后可直接按字符串比较先后"""
+    return datetime.datetime.strptime(date_str, DTFORMAT).strftime(DTFORMAT)
@@ -0,0 +1,140 @@
+import re
+
+from lxml import etree
+
+# 微博正文中表示发布位置的图标
+LOCATION_ICON = "timeline_card_small_location_default.png"
+# 纯文本正文中唯一允许出现的标签
+BR_PATTERN = re.compile(r"<br\s*/?>", re.IGNORECASE)
+# 评论中去除html标签使用的正则
+TAG_PATTERN = re.compile("<[^<]+?>")
+# lxml会改写的字符：字符实体、\r（转为\n）和\x00（转为U+FFFD）
+HTML_SPECIAL_CHARS = ("&", "\r", "\x00")
+# lxml解析时去掉的文档开头空白
+LEADING_WHITESPACE = " \t\n\f"
+
+
+class WeiboEntities:
+    """从微博正文中提取出的内容"""
+
+    __slots__ = ("text_list", "text", "article_url", "location", "topics", "at_users")
+
+    def __init__(self, text_list, article_url, location, topic_list, at_list):
+        self.text_list = text_list  # 与 //text() 相同的文本节点列表
+        self.text = "".join(text_list)  # 与 string(.) 相同的全部文本
+        self.article_url = article_url
+        self.location = location
+        self.topics = ",".join(topic_list)
+        self.at_users = ",".join(at_list)
+
+
+def extract_entities(selector):
+    """遍历一次微博正文的lxml树，同时提取文本、头条文章url、位置、话题和@用户
+
+    结果与原来分别执行的XPath完全一致：
+    文本为 //text()；头条文章url为 string(.) 以“发布了头条文章”开头时第一个 //a/@data-url；
+    位置为带位置图标的span之后的下一个span的文本；话题为 class='surl-text' 的span中
+    形如#话题#的文本；@用户为文本等于“@”加上href第4个字符之后内容的a标签。
+    """
+    text_list = []
+    collectors = []  # 正在收集文本的元素：[元素, 类型, 已收集的文本]
+    data_url = None
+    location = ""
+    location_pending = False  # 已遇到位置图标，下一个span的文本即为位置
+    location_found = False
+    topic_list = []
+    at_list = []
+
+    def add_text(text):
+        text_list.append(text)
+        for collector in collectors:
+            collector[2].append(text)
+
+    def add_comment_tails(node):
+        # iterwalk不会遍历注释等节点，它们本身的内容不属于文本，但其后的tail属于
+        while node is not None and not isinstance(node.tag, str):
+            if node.tail:
+                add_text(node.tail)
+            node = node.getnext()
+
+    for event, el in etree.iterwalk(selector, events=("start", "end")):
+        tag = el.tag
+        if event == "start":
+            if tag == "span":
+                if location_pending:
+                    collectors.append([el, "location", []])
+                    location_pending = False
+                if el.get("class") == "surl-text":
+                    collectors.append([el, "topic", []])
+                if not location_found:
+                    src = None
+                    for child in el:
+                        if child.tag == "img" and child.get("src") is not None:
+                            src = child.get("src")
+                            break
+                    if src is not None and LOCATION_ICON in src:
+                        location_found = True
+                        location_pending = True
+            elif tag == "a":
+                if data_url is None and el.get("data-url") is not None:
+                    data_url = el.get("data-url")
+                collectors.append([el, "at", []])
+            if el.text:
+                add_text(el.text)
+            add_comment_tails(el[0] if len(el) else None)
+        else:
+            while collectors and collectors[-1][0] is el:
+                _, kind, parts = collectors.pop()
+                text = "".join(parts)
+                if kind == "location":
+                    location = text
+                elif kind == "topic":
+                    if len(text) > 2 and text[0] == "#" and text[-1] == "#":
+                        topic_list.append(text[1:-1])
+                else:
+                    href = el.get("href")
+                    if href is not None and "@" + href[3:] == text:
+                        at_list.append(text[1:])
+            if el is not selector:
+                if el.tail:
+                    add_text(el.tail)
+                add_comment_tails(el.getnext())
+
+    article_url = ""
+    if "".join(text_list).startswith("发布了头条文章"):
+        if data_url and data_url.startswith("http://t.cn"):
+            article_url = data_url
+    return WeiboEntities(text_list, article_url, location, topic_list, at_list)
+
+
+def is_plain_text(text):
+    """判断正文是否只有文字和<br />，这样的正文不需要lxml解析
+
+    含有a、span等其他标签（链接、话题、@用户、表情、位置）或字符实体时返回False。
+    """
+    for char in HTML_SPECIAL_CHARS:
+        if char in text:
+            return False
+    if "<" not in text:
+        return True
+    return "<" not in BR_PATTERN.sub("", text)
+
+
+def parse_entities(text_body):
+    """解析微博正文，纯文本正文直接按<br />切分，其余正文使用lxml解析
+
+    两种方式的结果完全一致，纯文本正文没有头条文章、位置、话题和@用户。
+    """
+    if is_plain_text(text_body):
+        text = text_body.lstrip(LEADING_WHITESPACE)
+        text_list = [part for part in BR_PATTERN.split(text) if part]
+        return WeiboEntities(text_list, "", "", [], [])
+    selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
+    return extract_entities(selector)
+
+
+def strip_tags(text):
+    """去掉评论中的html标签，没有标签时直接返回原文"""
+    if "<" not in text:
+        return text
+    return TAG_PATTERN.sub("", text)
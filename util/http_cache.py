@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# 各类接口响应的默认缓存时间（秒），0代表不缓存，可在config.json的http_cache.ttl中覆盖
+# 默认只缓存发布后不再变化的长微博全文；用户信息、微博列表、评论和转发会随时变化，
+# 缓存的列表页与新获取的列表页混用时可能漏掉或重复微博，需要时再在配置中开启
+DEFAULT_TTL = {
+    "profile": 0,  # 用户主页信息 containerid=100505...
+    "info": 0,  # 用户资料卡片 containerid=230283..._-_INFO
+    "timeline": 0,  # 微博列表 containerid=230413... 及搜索
+    "detail": 604800,  # 长微博全文 m.weibo.cn/statuses/extend 及详情页 m.weibo.cn/detail/<id>
+    "comments": 0,  # 评论
+    "reposts": 0,  # 转发
+    "default": 0,
+}
+
+
+def get_cache_type(url, params=None):
+    """根据url和参数判断响应属于哪一类接口，用于确定缓存时间"""
+    containerid = str((params or {}).get("containerid", ""))
+    if "/api/container/getIndex" in url:
+        if containerid.startswith("100505"):
+            return "profile"
+        if containerid.endswith("_-_INFO"):
+            return "info"
+        if containerid.startswith("230413") or containerid.startswith("100103"):
+            return "timeline"
+        return "default"
+    if "/detail/" in url or "/statuses/extend" in url:
+        return "detail"
+    if "/comments/" in url or "buildComments" in url:
+        return "comments"
+    if "repostTimeline" in url:
+        return "reposts"
+    return "default"
+
+
+class HttpCache:
+    """保存在磁盘上的接口响应缓存
+
+    以url、请求参数和cookie为键，不同cookie获取的响应（如仅自己可见的内容）不会互相混用；
+    不同接口使用不同的缓存时间；缓存总大小超过上限时，
+    按最近访问时间淘汰最久未用的响应（LRU）。
+    """
+
+    def __init__(self, path, max_size_mb=200, ttl=None):
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.lock = threading.Lock()
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS http_cache (
+                key varchar(40) NOT NULL
+                ,url text
+                ,body text
+                ,size integer
+                ,expires_at real
+                ,accessed_at real
+                ,PRIMARY KEY (key)
+            )"""
+        )
+        self.con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_http_cache_accessed ON http_cache(accessed_at)"
+        )
+        self.con.commit()
+        self.size = self.con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM http_cache"
+        ).fetchone()[0]
+
+    def get_key(self, url, params=None, cookie=None):
+        if params:
+            url = url + "?" + urlencode(sorted((k, str(v)) for k, v in params.items() if v is not None))
+        # cookie只参与计算哈希，不以明文保存在缓存文件中
+        return hashlib.sha1((url + "\n" + (cookie or "")).encode("utf-8")).hexdigest()
+
+    def get(self, url, params=None, cookie=None):
+        """获取未过期的缓存内容，没有则返回None"""
+        if self.ttl.get(get_cache_type(url, params), 0) <= 0:
+            return None
+        key = self.get_key(url, params, cookie)
+        now = time.time()
+        with self.lock:
+            row = self.con.execute(
+                "SELECT body, expires_at FROM http_cache WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._delete(key)
+                return None
+            self.con.execute(
+                "UPDATE http_cache SET accessed_at=? WHERE key=?", (now, key)
+            )
+            self.con.commit()
+        logger.debug("命中响应缓存：%s %s", url, params)
+        return row[0]
+
+    def set(self, url, params, body, cookie=None):
+        """缓存响应内容，缓存超过上限时淘汰最久未访问的内容"""
+        ttl = self.ttl.get(get_cache_type(url, params), 0)
+        if ttl <= 0 or body is None:
+            return
+        key = self.get_key(url, params, cookie)
+        size = len(body.encode("utf-8"))
+        if size > self.max_size:
+            return
+        now = time.time()
+        with self.lock:
+            self._delete(key)
+            self.con.execute(
+                "INSERT INTO http_cache(key, url, body, size, expires_at, accessed_at) VALUES(?, ?, ?, ?, ?, ?)",
+                (key, url, body, size, now + ttl, now),
+            )
+            self.size += size
+            if self.size > self.max_size:
+                self._evict()
+            self.con.commit()
+
+    def _delete(self, key):
+        row = self.con.execute(
+            "SELECT size FROM http_cache WHERE key=?", (key,)
+        ).fetchone()
+        if row:
+            self.con.execute("DELETE FROM http_cache WHERE key=?", (key,))
+            self.size -= row[0]
+
+    def _evict(self):
+        """先删除过期内容，仍超过上限时按最近访问时间淘汰"""
+        now = time.time()
+        self.con.execute("DELETE FROM http_cache WHERE expires_at < ?", (now,))
+        self.size = self.con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM http_cache"
+        ).fetchone()[0]
+        while self.size > self.max_size:
+            rows = self.con.execute(
+                "SELECT key, size FROM http_cache ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.con.execute("DELETE FROM http_cache WHERE key=?", (key,))
+                self.size -= size
+                if self.size <= self.max_size:
+                    break
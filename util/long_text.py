@@ -0,0 +1,94 @@
+import json
+import logging
+
+from util.lru_cache import LRUCache
+from util.ratelimit import classify_response
+
+logger = logging.getLogger(__name__)
+
+EXTEND_URL = "https://m.weibo.cn/statuses/extend"
+DETAIL_URL = "https://m.weibo.cn/detail/%s"
+
+
+def merge_long_text(weibo_info, data):
+    """把statuses/extend返回的全文合并进列表页中的微博json"""
+    weibo_info = dict(weibo_info)
+    weibo_info["text"] = data["longTextContent"]
+    for key in ("reposts_count", "comments_count", "attitudes_count"):
+        if key in data:
+            weibo_info[key] = data[key]
+    return weibo_info
+
+
+class LongTextFetcher:
+    """长微博全文获取器
+
+    优先请求只返回全文的json接口statuses/extend，比下载整个详情页HTML小一个数量级；
+    该接口失败、或者微博图片超过9张（列表页只给出前9张，需要详情页中的完整图片）时，
+    再退回到解析m.weibo.cn/detail/<id>页面。结果按微博id缓存在内存中。
+    """
+
+    def __init__(self, wb, cache_size=1000):
+        self.wb = wb
+        self.cache = LRUCache(cache_size)
+
+    def fetch(self, id, weibo_info=None):
+        """获取长微博的完整微博json，可在预取线程中执行，失败时返回None"""
+        id = str(id)
+        cached = self.cache.get(id)
+        if cached is not None:
+            return cached
+        full_info = None
+        if weibo_info and (weibo_info.get("pic_num") or 0) <= 9:
+            full_info = self.fetch_extend(id, weibo_info)
+        if full_info is None:
+            full_info = self.fetch_detail(id)
+        if full_info is not None:
+            self.cache.set(id, full_info)
+        return full_info
+
+    def fetch_extend(self, id, weibo_info):
+        """通过statuses/extend接口获取全文"""
+        js, signal = self.wb.fetch_json(EXTEND_URL, params={"id": id}, timeout=10)
+        data = js.get("data") if signal == "ok" else None
+        if isinstance(data, dict) and data.get("longTextContent"):
+            return merge_long_text(weibo_info, data)
+        logger.info(f"statuses/extend未能获取微博 {id} 的全文（{signal}），改为解析详情页")
+        return None
+
+    def fetch_detail(self, id, max_retries=5):
+        """解析详情页HTML中的微博json"""
+        url = DETAIL_URL % id
+        logger.info(f"""URL: {url} """)
+        http_cache = self.wb.http_cache
+        headers = self.wb.get_headers()
+        if http_cache:
+            cached = http_cache.get(url, None, headers.get("Cookie"))
+            if cached is not None:
+                return json.loads(cached)
+        for i in range(max_retries):
+            if i:
+                headers = self.wb.get_headers()
+            response = self.wb.request(url, verify=False, headers=headers)
+            html = response.text
+            html = html[html.find('"status":') :]
+            html = html[: html.rfind('"call"')]
+            html = html[: html.rfind(",")]
+            html = "{" + html + "}"
+            try:
+                weibo_info = json.loads(html, strict=False).get("status")
+            except ValueError:
+                weibo_info = None
+            self.wb.report_signal(
+                url,
+                headers.get("Cookie"),
+                classify_response(response.status_code, {"data": weibo_info} if weibo_info else {}),
+            )
+            if weibo_info:
+                if http_cache:
+                    # 只缓存页面中的微博json，而不是整个html
+                    http_cache.set(
+                        url, None, json.dumps(weibo_info, ensure_ascii=False), headers.get("Cookie")
+                    )
+                return weibo_info
+        return None
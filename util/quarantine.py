@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 验证码隔离区的默认参数，可在config.json的captcha_quarantine中覆盖
+DEFAULT_QUARANTINE_CONFIG = {
+    "retry_seconds": 600,  # 被隔离的抓取任务等待多久后自动重试
+    "max_attempts": 3,  # 同一任务最多被隔离的次数，超过后放弃
+    "marker_file": "weibo/captcha_resolved",  # 该文件被创建或修改时视为验证码已处理
+    "poll_seconds": 1,  # 检查标记文件和配置文件是否变化的间隔
+}
+
+
+class CrawlBlocked(Exception):
+    """抓取被验证码或持续限流阻断，当前任务需要放入隔离区稍后重试"""
+
+    def __init__(self, reason, captcha_url=None, page=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.captcha_url = captcha_url
+        self.page = page
+
+
+class QuarantineItem:
+    """被隔离的抓取任务，记录重新开始时需要的位置"""
+
+    def __init__(self, user_config, query, page, got_count, reason, deadline, attempts):
+        self.user_config = user_config
+        self.query = query
+        self.page = page
+        self.got_count = got_count
+        self.reason = reason
+        self.deadline = deadline
+        self.attempts = attempts
+
+
+class Quarantine:
+    """验证码隔离区
+
+    出现验证码的用户（连同出错的页码）被放进隔离区，爬虫继续抓取其他用户；
+    到达重试时间，或者验证码被处理（调用resolve、标记文件被修改、配置文件中的cookie被更换）
+    后，再把隔离的任务取出重试。
+    """
+
+    def __init__(self, quarantine_config=None, watch_paths=()):
+        self.config = dict(DEFAULT_QUARANTINE_CONFIG)
+        if quarantine_config:
+            self.config.update(quarantine_config)
+        self.items = []
+        self.attempts = {}
+        self.resolved = threading.Event()
+        self.lock = threading.Lock()
+        self.watch_mtimes = {path: self.get_mtime(path) for path in watch_paths if path}
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def get_mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def add(self, user_config, query, page, got_count, reason, captcha_url=None):
+        """隔离一个抓取任务，超过最大隔离次数时放弃"""
+        key = (user_config["user_id"], query)
+        with self.lock:
+            attempts = self.attempts.get(key, 0) + 1
+            self.attempts[key] = attempts
+            if attempts > self.config["max_attempts"]:
+                logger.error(
+                    "用户 %s 已被隔离%d次，放弃抓取", user_config["user_id"], attempts - 1
+                )
+                return
+            deadline = time.time() + self.config["retry_seconds"]
+            self.items.append(
+                QuarantineItem(user_config, query, page, got_count, reason, deadline, attempts)
+            )
+        if captcha_url:
+            logger.warning("验证码地址：%s", captcha_url)
+        logger.warning(
+            "用户 %s 第%d页遇到%s，已放入隔离区，%d秒后或验证码处理后重试；"
+            "处理验证码后可修改%s或更换cookie以立即重试",
+            user_config["user_id"],
+            page,
+            reason,
+            self.config["retry_seconds"],
+            self.config["marker_file"],
+        )
+
+    def resolve(self):
+        """通知隔离区验证码已处理，等待中的任务会立即重试"""
+        self.resolved.set()
+
+    def poll_watch(self):
+        """检查标记文件和配置文件是否变化，变化时视为验证码已处理"""
+        for path, mtime in self.watch_mtimes.items():
+            current = self.get_mtime(path)
+            if current is not None and current != mtime:
+                self.watch_mtimes[path] = current
+                logger.info("检测到%s发生变化，视为验证码已处理", path)
+                self.resolve()
+
+    def wait(self):
+        """阻塞直到有任务可以重试
+
+        Returns:
+            tuple: (可以重试的任务列表, 是否因为验证码被处理而唤醒)
+        """
+        while self.items:
+            self.poll_watch()
+            if self.resolved.is_set():
+                self.resolved.clear()
+                with self.lock:
+                    items, self.items = self.items, []
+                return items, True
+            now = time.time()
+            with self.lock:
+                due = [item for item in self.items if item.deadline <= now]
+                if due:
+                    self.items = [item for item in self.items if item.deadline > now]
+                    return due, False
+                timeout = min(item.deadline for item in self.items) - now
+            self.resolved.wait(min(timeout, self.config["poll_seconds"]))
+        return [], False
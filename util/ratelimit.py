@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 各接口默认的请求速率（次/秒），可在config.json的rate_limit中覆盖
+DEFAULT_RATES = {
+    "default": 1.0,
+    "getIndex": 0.5,
+    "detail": 0.5,
+    "comments": 0.3,
+    "reposts": 0.3,
+    "buildComments": 0.5,
+    "show": 0.5,
+    "extend": 0.5,
+}
+
+# 根据url中的路径判断所属接口
+ENDPOINT_PATTERNS = [
+    ("/api/container/getIndex", "getIndex"),
+    ("/detail/", "detail"),
+    ("/comments/hotflow", "comments"),
+    ("/api/comments/show", "comments"),
+    ("/api/statuses/repostTimeline", "reposts"),
+    ("/ajax/statuses/buildComments", "buildComments"),
+    ("/statuses/show", "show"),
+    ("/statuses/extend", "extend"),
+]
+
+
+# 自适应限速的默认参数：每次正常响应速率增加increase，出现限流迹象时速率乘以decrease
+DEFAULT_ADAPTIVE = {
+    "enable": 1,
+    "increase": 0.05,
+    "decrease": 0.5,
+    "min_rate": 0.02,
+    "max_rate": 2.0,
+    "cooldown": 2.0,  # 两次降速之间的最短间隔（秒），避免同一批失败的请求把速率连续砍到底
+}
+
+# 被视为限流迹象的响应类别
+THROTTLE_SIGNALS = ("empty", "captcha", "throttled", "decode_error", "error")
+
+
+def classify_response(status_code, js):
+    """判断响应类别
+
+    Returns:
+        str: ok 正常；empty 没有data；captcha 需要验证码；throttled 被限流(403/418/429)；
+        decode_error 无法解析为json；error 请求失败或其他错误状态码
+    """
+    if status_code is None:
+        return "error"
+    if status_code in (403, 418, 429):
+        return "throttled"
+    if status_code >= 400:
+        return "error"
+    if not isinstance(js, dict):
+        return "decode_error"
+    if "data" not in js:
+        return "captcha" if js.get("url") else "empty"
+    return "ok"
+
+
+def get_endpoint(url):
+    """获取url对应的接口名，用于区分不同接口的令牌桶"""
+    for pattern, endpoint in ENDPOINT_PATTERNS:
+        if pattern in url:
+            return endpoint
+    return "default"
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒产生的令牌数，capacity为桶中最多积攒的令牌数
+
+    令牌不足时可以预支，预支的请求按先后顺序排队等待，保证整体速率不超过rate。
+    rate不大于0时不做限制。
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.last_decrease = 0
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """调整令牌产生速率"""
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def reserve(self, count=1):
+        """预定count个令牌，返回拿到令牌前需要等待的秒数"""
+        with self.lock:
+            if self.rate <= 0:
+                return 0
+            self._refill()
+            self.tokens -= count
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self, count=1):
+        """阻塞直到拿到令牌，返回等待的秒数"""
+        wait = self.reserve(count)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, count=1):
+        """在协程中等待令牌，返回等待的秒数"""
+        wait = self.reserve(count)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """统一的限速器，每个接口、每个cookie各自拥有一个令牌桶
+
+    开启自适应限速（AIMD）后，每次请求的结果通过report反馈回来：
+    响应正常时速率线性增加，出现限流迹象时速率成倍下降，从而自动找到账号能承受的最高速率。
+    """
+
+    def __init__(self, rates=None, adaptive=None):
+        self.rates = dict(DEFAULT_RATES)
+        if rates:
+            self.rates.update(rates)
+        self.adaptive = dict(DEFAULT_ADAPTIVE)
+        if adaptive:
+            self.adaptive.update(adaptive)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_rate(self, endpoint):
+        return self.rates.get(endpoint, self.rates["default"])
+
+    def bucket(self, endpoint, cookie=""):
+        """获取某个接口、某个cookie对应的令牌桶，不存在则创建"""
+        key = (endpoint, cookie or "")
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.get_rate(endpoint))
+                self.buckets[key] = bucket
+            return bucket
+
+    def acquire(self, endpoint, cookie=""):
+        return self.bucket(endpoint, cookie).acquire()
+
+    async def acquire_async(self, endpoint, cookie=""):
+        return await self.bucket(endpoint, cookie).acquire_async()
+
+    def report(self, endpoint, cookie, signal):
+        """根据响应类别调整该接口、该cookie的请求速率"""
+        if not self.adaptive["enable"]:
+            return
+        bucket = self.bucket(endpoint, cookie)
+        rate = bucket.rate if bucket.rate > 0 else self.adaptive["max_rate"]
+        if signal == "ok":
+            if rate < self.adaptive["max_rate"]:
+                bucket.set_rate(min(self.adaptive["max_rate"], rate + self.adaptive["increase"]))
+        elif signal in THROTTLE_SIGNALS:
+            now = time.monotonic()
+            if now - bucket.last_decrease < self.adaptive["cooldown"]:
+                return
+            bucket.last_decrease = now
+            rate = max(self.adaptive["min_rate"], rate * self.adaptive["decrease"])
+            bucket.set_rate(rate)
+            logger.warning("接口 %s 返回 %s，请求速率降为每秒 %.3f 次", endpoint, signal, rate)
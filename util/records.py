@@ -0,0 +1,377 @@
+import sys
+from collections import OrderedDict
+from operator import attrgetter
+
+
+class Record:
+    """使用__slots__保存字段的记录，代替原来的OrderedDict
+
+    FIELDS中的字段在创建时即被赋予默认值，OPTIONAL中的字段只有赋值后才存在；
+    支持 record["key"]、get、in、keys、values、items 等字典操作，原来按字典访问的代码不需要修改。
+    """
+
+    __slots__ = ()
+    FIELDS = ()  # 必有字段，决定keys()和to_dict()中的顺序
+    OPTIONAL = ()  # 可选字段，排在必有字段之后
+    DEFAULTS = {}  # 必有字段的默认值，未列出的字段默认为空字符串
+    TEXT_FIELDS = ()  # 需要去除乱码的文本字段
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.NAMES = frozenset(cls.FIELDS + cls.OPTIONAL)
+
+    def __init__(self, **fields):
+        defaults = self.DEFAULTS
+        for name in self.FIELDS:
+            setattr(self, name, defaults.get(name, ""))
+        for name, value in fields.items():
+            self[name] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典（如json）还原记录，忽略不属于该记录的键"""
+        record = cls()
+        for name in cls.FIELDS + cls.OPTIONAL:
+            if name in data:
+                setattr(record, name, data[name])
+        return record
+
+    def __getitem__(self, key):
+        if key not in self.NAMES:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.NAMES:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.OPTIONAL:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self.NAMES and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.items() == other.items()
+        return NotImplemented
+
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__, ", ".join(f"{k}={v!r}" for k, v in self.items())
+        )
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self else default
+
+    def keys(self):
+        return list(self.FIELDS) + [name for name in self.OPTIONAL if hasattr(self, name)]
+
+    def values(self):
+        return [getattr(self, name) for name in self.keys()]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def to_dict(self):
+        """转换为OrderedDict，嵌套的记录一并转换，用于写入json、MongoDB等"""
+        data = OrderedDict()
+        for name, value in self.items():
+            data[name] = value.to_dict() if isinstance(value, Record) else value
+        return data
+
+    def standardize(self):
+        """去除文本字段中的零宽空格和当前终端编码无法显示的字符"""
+        encoding = sys.stdout.encoding or "utf-8"
+        for name in self.TEXT_FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, str):
+                setattr(
+                    self,
+                    name,
+                    value.replace("\u200b", "").encode(encoding, "ignore").decode(encoding),
+                )
+        return self
+
+
+class WeiboRecord(Record):
+    """一条微博"""
+
+    FIELDS = (
+        "user_id",
+        "screen_name",
+        "id",
+        "bid",
+        "text",
+        "article_url",
+        "pics",
+        "video_url",
+        "live_photo_url",
+        "location",
+        "created_at",
+        "source",
+        "attitudes_count",
+        "comments_count",
+        "reposts_count",
+        "topics",
+        "at_users",
+        "full_created_at",
+    )
+    OPTIONAL = ("llm_analysis", "retweet")
+    DEFAULTS = {"id": 0, "attitudes_count": 0, "comments_count": 0, "reposts_count": 0}
+    TEXT_FIELDS = (
+        "screen_name",
+        "bid",
+        "text",
+        "article_url",
+        "pics",
+        "video_url",
+        "live_photo_url",
+        "location",
+        "created_at",
+        "source",
+        "topics",
+        "at_users",
+    )
+    __slots__ = FIELDS + OPTIONAL
+
+    @classmethod
+    def from_dict(cls, data):
+        record = super().from_dict(data)
+        retweet = getattr(record, "retweet", None)
+        if isinstance(retweet, dict):
+            record.retweet = cls.from_dict(retweet)
+        return record
+
+    @property
+    def retweet_id(self):
+        """被转发微博的id，原创微博为空字符串"""
+        retweet = getattr(self, "retweet", None)
+        return retweet.id if retweet else ""
+
+
+class UserRecord(Record):
+    """一个微博用户"""
+
+    FIELDS = (
+        "id",
+        "screen_name",
+        "gender",
+        "birthday",
+        "location",
+        "education",
+        "company",
+        "registration_time",
+        "sunshine",
+        "statuses_count",
+        "followers_count",
+        "follow_count",
+        "description",
+        "profile_url",
+        "profile_image_url",
+        "avatar_hd",
+        "urank",
+        "mbrank",
+        "verified",
+        "verified_type",
+        "verified_reason",
+    )
+    DEFAULTS = {
+        "statuses_count": 0,
+        "followers_count": 0,
+        "follow_count": 0,
+        "urank": 0,
+        "mbrank": 0,
+        "verified": False,
+        "verified_type": -1,
+    }
+    TEXT_FIELDS = (
+        "screen_name",
+        "gender",
+        "birthday",
+        "location",
+        "education",
+        "company",
+        "registration_time",
+        "sunshine",
+        "description",
+        "profile_url",
+        "profile_image_url",
+        "avatar_hd",
+        "verified_reason",
+    )
+    __slots__ = FIELDS
+
+
+class CommentRecord(Record):
+    """一条评论，字段与comments表的列一致"""
+
+    FIELDS = (
+        "id",
+        "bid",
+        "root_id",
+        "created_at",
+        "weibo_id",
+        "user_id",
+        "user_screen_name",
+        "user_avatar_url",
+        "text",
+        "pic_url",
+        "like_count",
+    )
+    __slots__ = FIELDS
+
+
+class RepostRecord(Record):
+    """一条转发，字段与reposts表的列一致"""
+
+    FIELDS = (
+        "id",
+        "bid",
+        "created_at",
+        "weibo_id",
+        "user_id",
+        "user_screen_name",
+        "user_avatar_url",
+        "text",
+        "like_count",
+    )
+    __slots__ = FIELDS
+
+
+class Projection:
+    """把记录投影为某个输出（csv列、数据库表）的一行
+
+    columns为 (列名, 字段名或函数) 的列表，同一份记录按不同的投影写入不同的输出，
+    不再为每个输出重新构造字典。
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(name for name, _ in columns)
+        # 投影用到的记录字段，用于决定解析时需要计算哪些字段
+        self.fields = frozenset(source for _, source in columns if isinstance(source, str))
+        self.getters = tuple(
+            attrgetter(source) if isinstance(source, str) else source
+            for _, source in columns
+        )
+
+    def row(self, record):
+        return tuple(getter(record) for getter in self.getters)
+
+
+def _csv_id(record):
+    # 在id后加制表符，防止Excel把长数字显示为科学计数法
+    return str(record.id) + "\t"
+
+
+# 微博csv的列：(字段, 表头)
+WEIBO_CSV_COLUMNS = (
+    (_csv_id, "id"),
+    ("bid", "bid"),
+    ("text", "正文"),
+    ("article_url", "头条文章url"),
+    ("pics", "原始图片url"),
+    ("video_url", "视频url"),
+    ("live_photo_url", "Live Photo视频url"),
+    ("location", "位置"),
+    ("created_at", "日期"),
+    ("source", "工具"),
+    ("attitudes_count", "点赞数"),
+    ("comments_count", "评论数"),
+    ("reposts_count", "转发数"),
+    ("topics", "话题"),
+    ("at_users", "@用户"),
+    ("full_created_at", "完整日期"),
+)
+WEIBO_CSV = Projection([(header, source) for source, header in WEIBO_CSV_COLUMNS])
+# 转发微博在csv中额外写入的源微博列
+RETWEET_CSV = Projection(
+    [("源用户id", "user_id"), ("源用户昵称", "screen_name")]
+    + [("源微博" + header, source) for source, header in WEIBO_CSV_COLUMNS]
+)
+
+# weibo表（SQLite、MySQL）的列
+WEIBO_TABLE = Projection(
+    [
+        ("id", "id"),
+        ("bid", "bid"),
+        ("user_id", "user_id"),
+        ("screen_name", "screen_name"),
+        ("text", "text"),
+        ("article_url", "article_url"),
+        ("topics", "topics"),
+        ("at_users", "at_users"),
+        ("pics", "pics"),
+        ("video_url", "video_url"),
+        ("location", "location"),
+        ("created_at", "full_created_at"),
+        ("source", "source"),
+        ("attitudes_count", "attitudes_count"),
+        ("comments_count", "comments_count"),
+        ("reposts_count", "reposts_count"),
+        ("retweet_id", "retweet_id"),
+    ]
+)
+
+# 用户csv的表头，顺序与UserRecord.FIELDS一致
+USER_CSV_HEADERS = (
+    "用户id",
+    "昵称",
+    "性别",
+    "生日",
+    "所在地",
+    "学习经历",
+    "公司",
+    "注册时间",
+    "阳光信用",
+    "微博数",
+    "粉丝数",
+    "关注数",
+    "简介",
+    "主页",
+    "头像",
+    "高清头像",
+    "微博等级",
+    "会员等级",
+    "是否认证",
+    "认证类型",
+    "认证信息",
+)
+# MySQL的user表与UserRecord字段相同
+USER_MYSQL_TABLE = Projection([(name, name) for name in UserRecord.FIELDS])
+# SQLite的user表
+USER_SQLITE_TABLE = Projection(
+    [
+        ("id", "id"),
+        ("nick_name", "screen_name"),
+        ("gender", "gender"),
+        ("follower_count", "followers_count"),
+        ("follow_count", "follow_count"),
+        ("birthday", "birthday"),
+        ("location", "location"),
+        ("edu", "education"),
+        ("company", "company"),
+        ("reg_date", "registration_time"),
+        ("main_page_url", "profile_url"),
+        ("avatar_url", "avatar_hd"),
+        ("bio", "description"),
+    ]
+)
+
+COMMENT_TABLE = Projection([(name, name) for name in CommentRecord.FIELDS])
+REPOST_TABLE = Projection([(name, name) for name in RepostRecord.FIELDS])
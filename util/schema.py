@@ -0,0 +1,162 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# weibodata.db的表结构，weibo.py、get_single_weibo_comments.py和danmu_server.py共用
+CREATE_TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS user (
+        id varchar(64) NOT NULL
+        ,nick_name varchar(64) NOT NULL
+        ,gender varchar(6)
+        ,follower_count integer
+        ,follow_count integer
+        ,birthday varchar(10)
+        ,location varchar(32)
+        ,edu varchar(32)
+        ,company varchar(32)
+        ,reg_date DATETIME
+        ,main_page_url text
+        ,avatar_url text
+        ,bio text
+        ,PRIMARY KEY (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS weibo (
+        id varchar(20) NOT NULL
+        ,bid varchar(12) NOT NULL
+        ,user_id varchar(20)
+        ,screen_name varchar(30)
+        ,text varchar(2000)
+        ,article_url varchar(100)
+        ,topics varchar(200)
+        ,at_users varchar(1000)
+        ,pics varchar(3000)
+        ,video_url varchar(1000)
+        ,location varchar(100)
+        ,created_at DATETIME
+        ,source varchar(30)
+        ,attitudes_count INT
+        ,comments_count INT
+        ,reposts_count INT
+        ,retweet_id varchar(20)
+        ,PRIMARY KEY (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS bins (
+        id integer PRIMARY KEY AUTOINCREMENT
+        ,ext varchar(10) NOT NULL /*file extension*/
+        ,data blob NOT NULL
+        ,weibo_id varchar(20)
+        ,comment_id varchar(20)
+        ,path text
+        ,url text
+    );
+
+    CREATE TABLE IF NOT EXISTS comments (
+        id varchar(20) NOT NULL
+        ,bid varchar(20) NOT NULL
+        ,weibo_id varchar(32) NOT NULL
+        ,root_id varchar(20)
+        ,user_id varchar(20) NOT NULL
+        ,created_at varchar(20)
+        ,user_screen_name varchar(64) NOT NULL
+        ,user_avatar_url text
+        ,text varchar(1000)
+        ,pic_url text
+        ,like_count integer
+        ,PRIMARY KEY (id)
+    );
+
+    CREATE TABLE IF NOT EXISTS reposts (
+        id varchar(20) NOT NULL
+        ,bid varchar(20) NOT NULL
+        ,weibo_id varchar(32) NOT NULL
+        ,user_id varchar(20) NOT NULL
+        ,created_at varchar(20)
+        ,user_screen_name varchar(64) NOT NULL
+        ,user_avatar_url text
+        ,text varchar(1000)
+        ,like_count integer
+        ,PRIMARY KEY (id)
+    );
+"""
+
+# 旧版本get_single_weibo_comments.py和danmu_server.py建立的comments表只有
+# id、weibo_id、user_screen_name、text和created_at五列，这里是需要补上的列
+COMMENT_COLUMNS = (
+    ("bid", "varchar(20) NOT NULL DEFAULT ''"),
+    ("root_id", "varchar(20)"),
+    ("user_id", "varchar(20) NOT NULL DEFAULT ''"),
+    ("user_avatar_url", "text"),
+    ("pic_url", "text"),
+    ("like_count", "integer"),
+)
+
+# 常用查询需要的索引：按微博查评论和转发、按用户查微博、下载文件前按本地路径查重
+# （sqlite_exist_file的 WHERE path=? ，索引包含url，查询不需要回表）；
+# 弹幕页面的 ORDER BY id DESC LIMIT 使用主键索引
+CREATE_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_comments_weibo_id_created_at ON comments (weibo_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_reposts_weibo_id_created_at ON reposts (weibo_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_weibo_user_id_created_at ON weibo (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_bins_path_url ON bins (path, url);
+"""
+
+
+def add_comment_columns(con):
+    """给旧的简化comments表补上缺少的列"""
+    existing = {row[1] for row in con.execute("PRAGMA table_info(comments)")}
+    for name, definition in COMMENT_COLUMNS:
+        if name not in existing:
+            con.execute("ALTER TABLE comments ADD COLUMN {} {}".format(name, definition))
+
+
+# (版本号, 说明, SQL脚本或以连接为参数的函数)，只能在末尾追加，已发布的迁移不要修改
+MIGRATIONS = (
+    (1, "建立user、weibo、bins、comments、reposts表", CREATE_TABLES_SQL),
+    (2, "补全简化的comments表", add_comment_columns),
+    (3, "建立查询索引", CREATE_INDEXES_SQL),
+)
+
+
+def get_version(con):
+    row = con.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(con):
+    """把数据库升级到最新的表结构，已经是最新时不做任何修改
+
+    已执行的迁移记录在schema_version表中。每个迁移都可以重复执行，
+    中途失败时不会记录版本，下次连接时重新执行。
+    """
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+            version integer NOT NULL
+            ,description text
+            ,applied_at real
+            ,PRIMARY KEY (version)
+        )"""
+    )
+    con.commit()
+    version = get_version(con)
+    for target, description, step in MIGRATIONS:
+        if target <= version:
+            continue
+        try:
+            if callable(step):
+                step(con)
+            else:
+                for statement in step.split(";"):
+                    if statement.strip():
+                        con.execute(statement)
+            con.execute(
+                "INSERT INTO schema_version(version, description, applied_at) VALUES(?, ?, ?)",
+                (target, description, time.time()),
+            )
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        logger.info("数据库已升级到版本%d：%s", target, description)
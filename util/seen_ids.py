@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+logger = logging.getLogger(__name__)
+
+
+class SeenIds:
+    """所有已经写入过的微博id，用于在解析前跳过已获取过的微博
+
+    id以升序排列的8字节整数保存在path中，加载后按二分查找，每个id只占8字节，
+    百万条微博也只有约8MB；新写入的id先以追加方式记录到path + ".new"，
+    程序中断也不会丢失，下次加载或关闭时再合并进有序文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + ".new"
+        self.lock = threading.Lock()
+        id_dir = os.path.dirname(path)
+        if id_dir and not os.path.isdir(id_dir):
+            os.makedirs(id_dir)
+        self.ids = self.read_ids(path)
+        self.new_ids = set(self.read_ids(self.journal_path))
+        self.pending = []  # 还没有追加到日志文件中的id
+        if self.new_ids:
+            self.compact()
+
+    @staticmethod
+    def read_ids(path):
+        ids = array("q")
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            ids.frombytes(data[: len(data) - len(data) % ids.itemsize])
+        return ids
+
+    def __len__(self):
+        return len(self.ids) + len(self.new_ids)
+
+    def __contains__(self, id):
+        id = int(id)
+        return id in self.new_ids or self.in_sorted(id)
+
+    def in_sorted(self, id):
+        i = bisect_left(self.ids, id)
+        return i < len(self.ids) and self.ids[i] == id
+
+    def add(self, id):
+        id = int(id)
+        with self.lock:
+            if id not in self:
+                self.new_ids.add(id)
+                self.pending.append(id)
+
+    def flush(self):
+        """把新增的id追加到日志文件"""
+        with self.lock:
+            if not self.pending:
+                return
+            with open(self.journal_path, "ab") as f:
+                f.write(array("q", self.pending).tobytes())
+            self.pending = []
+
+    def compact(self):
+        """把日志中的id合并进有序文件，合并完成后删除日志"""
+        new_ids = sorted(id for id in self.new_ids if not self.in_sorted(id))
+        merged = array("q", merge(self.ids, new_ids))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(merged.tobytes())
+        os.replace(tmp_path, self.path)
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+        self.ids = merged
+        self.new_ids = set()
+        self.pending = []
+
+    def close(self):
+        with self.lock:
+            if self.new_ids:
+                self.compact()
@@ -0,0 +1,115 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from util.schema import migrate
+
+logger = logging.getLogger(__name__)
+
+# 打开连接时设置的PRAGMA：WAL日志下读写互不阻塞，synchronous=NORMAL在WAL下只在检查点时同步磁盘，
+# cache_size为负数时单位为KB
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64000),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+
+class SQLiteDB:
+    """weibodata.db的长连接
+
+    每个进程只使用一个写连接，第一次使用时才打开；写入在同一个事务中累积，
+    达到batch_size行或距离事务开始超过batch_seconds秒时提交一次，不再每行提交。
+    调用commit或close时提交剩余的写入。
+    成批的数据使用insert_many写入，每张表每组列的INSERT语句只生成一次，一批只执行一次executemany。
+    """
+
+    def __init__(self, path, batch_size=1000, batch_seconds=2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.con = None
+        self.lock = threading.RLock()
+        self.pending = 0  # 当前事务中还没有提交的行数
+        self.started_at = 0  # 当前事务开始的时间
+        self.statements = {}  # (表名, 列名) -> INSERT语句
+
+    def exists(self):
+        return self.con is not None or os.path.exists(self.path)
+
+    def connect(self):
+        """获取连接，第一次连接时把表结构升级到最新版本"""
+        with self.lock:
+            if self.con is None:
+                db_dir = os.path.dirname(self.path)
+                if db_dir and not os.path.isdir(db_dir):
+                    os.makedirs(db_dir)
+                con = sqlite3.connect(self.path, check_same_thread=False)
+                for name, value in PRAGMAS:
+                    con.execute("PRAGMA {}={}".format(name, value))
+                migrate(con)
+                self.con = con
+            return self.con
+
+    def execute(self, sql, params=()):
+        """执行一条写入语句，按批提交"""
+        with self.lock:
+            self.connect().execute(sql, params)
+            self.written(1)
+
+    def insert_sql(self, table, columns):
+        """获取插入语句，已存在的行按主键替换"""
+        key = (table, tuple(columns))
+        sql = self.statements.get(key)
+        if sql is None:
+            sql = "INSERT OR REPLACE INTO {}({}) VALUES({})".format(
+                table, ",".join(key[1]), ",".join(["?"] * len(key[1]))
+            )
+            self.statements[key] = sql
+        return sql
+
+    def insert_many(self, table, columns, rows):
+        """用一次executemany写入一批行，每行的值与columns一一对应"""
+        rows = list(rows)
+        if not rows:
+            return
+        sql = self.insert_sql(table, columns)
+        with self.lock:
+            self.connect().executemany(sql, rows)
+            self.written(len(rows))
+
+    def insert_records(self, table, projection, records):
+        """按投影（util.records.Projection）把一批记录写入表中"""
+        self.insert_many(table, projection.columns, [projection.row(r) for r in records])
+
+    def query(self, sql, params=()):
+        """查询，能看到本连接中还没有提交的写入"""
+        with self.lock:
+            return self.connect().execute(sql, params).fetchall()
+
+    def written(self, count):
+        if not self.pending:
+            self.started_at = time.monotonic()
+        self.pending += count
+        if (
+            self.pending >= self.batch_size
+            or time.monotonic() - self.started_at >= self.batch_seconds
+        ):
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            if self.con is not None and self.pending:
+                self.con.commit()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if self.con is not None:
+                self.commit()
+                self.con.close()
+                self.con = None
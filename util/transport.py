@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 需要录制或回放的微博域名
+FIXTURE_HOSTS = ("m.weibo.cn", "weibo.com")
+
+
+def get_fixture_key(url, params=None):
+    """把请求归一化为 host/path?排序后的参数，作为录制和回放时的键"""
+    parts = urlsplit(str(url))
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(k, str(v)) for k, v in params.items() if v is not None]
+    key = parts.netloc + parts.path
+    if query:
+        key += "?" + urlencode(sorted(query))
+    return key
+
+
+class FixtureArchive:
+    """录制的响应存档，每个响应保存为目录下的一个json文件"""
+
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+        self.lock = threading.Lock()
+
+    def save(self, key, status, content_type, body):
+        """保存一个响应，相同请求的新响应会覆盖旧响应"""
+        if not os.path.isdir(self.fixture_dir):
+            os.makedirs(self.fixture_dir)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json"
+        fixture = {
+            "key": key,
+            "status": status,
+            "content_type": content_type,
+            "body": body,
+        }
+        with self.lock:
+            with open(os.path.join(self.fixture_dir, name), "w", encoding="utf-8") as f:
+                json.dump(fixture, f, ensure_ascii=False)
+
+    def load(self):
+        """读取全部响应，返回 {键: 响应}"""
+        fixtures = {}
+        if not os.path.isdir(self.fixture_dir):
+            return fixtures
+        for name in sorted(os.listdir(self.fixture_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.fixture_dir, name), encoding="utf-8") as f:
+                fixture = json.load(f)
+            fixtures[fixture["key"]] = fixture
+        return fixtures
+
+
+class Transport:
+    """请求的录制/回放层
+
+    record模式：正常访问微博，同时把每个响应保存到fixture_dir；
+    replay模式：把发往微博的请求改写到本地的mock_server.py，由它回放录制的响应。
+    """
+
+    def __init__(self, mode, fixture_dir, replay_url):
+        self.mode = mode
+        self.archive = FixtureArchive(fixture_dir)
+        self.replay_url = replay_url.rstrip("/")
+
+    @classmethod
+    def from_config(cls, transport_config, base_dir=""):
+        """根据config.json中的transport配置创建，未开启时返回None"""
+        transport_config = transport_config or {}
+        mode = transport_config.get("mode") or ""
+        if mode not in ("record", "replay"):
+            return None
+        fixture_dir = transport_config.get("fixture_dir") or "fixtures"
+        if not os.path.isabs(fixture_dir):
+            fixture_dir = os.path.join(base_dir, fixture_dir)
+        replay_url = transport_config.get("replay_url") or "http://127.0.0.1:8765"
+        logger.info("请求%s模式已开启，响应存档目录：%s", "录制" if mode == "record" else "回放", fixture_dir)
+        return cls(mode, fixture_dir, replay_url)
+
+    def is_weibo_url(self, url):
+        return urlsplit(str(url)).netloc in FIXTURE_HOSTS
+
+    def rewrite(self, url):
+        """replay模式下把微博的url改写为mock server的url"""
+        if self.mode != "replay" or not self.is_weibo_url(url):
+            return url
+        parts = urlsplit(str(url))
+        url = self.replay_url + "/" + parts.netloc + parts.path
+        if parts.query:
+            url += "?" + parts.query
+        return url
+
+    def record(self, url, status, content_type, body, params=None):
+        """record模式下保存响应"""
+        if self.mode != "record" or not self.is_weibo_url(url):
+            return
+        self.archive.save(get_fixture_key(url, params), status, content_type, body)
+
+    def mount(self, session, max_retries=5):
+        """把录制/回放层挂载到requests的session上"""
+        adapter = TransportAdapter(self, max_retries=max_retries)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+
+class TransportAdapter(HTTPAdapter):
+    """在requests发送请求前后接入录制/回放的HTTPAdapter"""
+
+    def __init__(self, transport, **kwargs):
+        self.transport = transport
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        original_url = request.url
+        request.url = self.transport.rewrite(request.url)
+        response = super().send(request, **kwargs)
+        if self.transport.mode == "record":
+            self.transport.record(
+                original_url,
+                response.status_code,
+                response.headers.get("Content-Type", ""),
+                response.text,
+            )
+        return response
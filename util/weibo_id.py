@@ -0,0 +1,114 @@
+import logging
+import re
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 微博bid使用的base62字母表
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE62 = {c: i for i, c in enumerate(ALPHABET)}
+
+MID_PATTERN = re.compile(r"^\d{10,20}$")
+BID_PATTERN = re.compile(r"^[0-9a-zA-Z]{8,10}$")
+
+
+def base62_encode(num):
+    if num == 0:
+        return ALPHABET[0]
+    chars = []
+    while num:
+        num, rem = divmod(num, 62)
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def base62_decode(s):
+    num = 0
+    for c in s:
+        num = num * 62 + BASE62[c]
+    return num
+
+
+def mid_to_bid(mid):
+    """把数字微博id转换为bid
+
+    从右往左每7位数字一组，每组转为base62，除最左边一组外补足4个字符。
+    """
+    mid = str(mid)
+    chunks = []
+    end = len(mid)
+    while end > 0:
+        start = max(0, end - 7)
+        chunk = base62_encode(int(mid[start:end]))
+        if start > 0:
+            chunk = chunk.rjust(4, "0")
+        chunks.append(chunk)
+        end = start
+    return "".join(reversed(chunks))
+
+
+def bid_to_mid(bid):
+    """把bid转换为数字微博id
+
+    从右往左每4个字符一组，每组按base62解码，除最左边一组外补足7位数字。
+    """
+    chunks = []
+    end = len(bid)
+    while end > 0:
+        start = max(0, end - 4)
+        chunk = str(base62_decode(bid[start:end]))
+        if start > 0:
+            chunk = chunk.rjust(7, "0")
+        chunks.append(chunk)
+        end = start
+    return "".join(reversed(chunks))
+
+
+def is_mid(id_str):
+    """判断是否为数字微博id"""
+    return bool(MID_PATTERN.match(id_str or ""))
+
+
+def is_bid(id_str):
+    """判断是否为bid（字母数字组合，不全是数字）"""
+    return bool(BID_PATTERN.match(id_str or "")) and not id_str.isdigit()
+
+
+def normalize_input(input_str):
+    """从输入中提取微博id或bid，支持完整链接、bid和微博id
+
+    支持 https://weibo.com/<uid>/<bid>、https://m.weibo.cn/detail/<id>、
+    https://m.weibo.cn/status/<bid>、带 ?id=/?mid= 参数的链接等形式。
+    """
+    input_str = (input_str or "").strip()
+    if "/" not in input_str and "?" not in input_str:
+        return input_str
+    parts = urlsplit(input_str if "://" in input_str else "https://" + input_str)
+    query = parse_qs(parts.query)
+    for key in ("id", "mid"):
+        if query.get(key):
+            return query[key][0].strip()
+    segments = [s for s in parts.path.split("/") if s]
+    return segments[-1].strip() if segments else ""
+
+
+def resolve_mid(input_str, fetch=None):
+    """把链接、bid或微博id解析为数字微博id
+
+    bid在本地解码，不需要请求网络；只有无法识别的格式才调用fetch(id)从网络获取，
+    获取失败时返回None。
+    """
+    id_str = normalize_input(input_str)
+    if is_mid(id_str):
+        return id_str
+    if is_bid(id_str):
+        return bid_to_mid(id_str)
+    if fetch and id_str:
+        logger.info(f"无法在本地解析 {id_str}，改为从网络获取微博ID")
+        return fetch(id_str)
+    return None
+
+
+def resolve_many(inputs, fetch=None):
+    """批量解析，返回 {输入: 微博id}"""
+    return {input_str: resolve_mid(input_str, fetch) for input_str in inputs}
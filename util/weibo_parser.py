@@ -0,0 +1,185 @@
+import logging
+
+from util.dateutil import standardize_date
+from util.html_extract import parse_entities
+from util.records import WeiboRecord
+
+logger = logging.getLogger(__name__)
+
+
+def string_to_int(string):
+    """字符串转换为整数"""
+    if isinstance(string, int):
+        return string
+    elif string.endswith("万+"):
+        string = string[:-2] + "0000"
+    elif string.endswith("万"):
+        string = float(string[:-1]) * 10000
+    elif string.endswith("亿"):
+        string = float(string[:-1]) * 100000000
+    return int(string)
+
+
+def get_pics(weibo_info):
+    """获取微博原始图片url"""
+    if weibo_info.get("pics"):
+        pic_info = weibo_info["pics"]
+        pic_list = [pic["large"]["url"] for pic in pic_info]
+        pics = ",".join(pic_list)
+    else:
+        pics = ""
+    return pics
+
+
+def get_live_photo_url(weibo_info):
+    """获取Live Photo视频URL"""
+    live_photo_list = weibo_info.get("live_photo", [])
+    return ";".join(live_photo_list) if live_photo_list else ""
+
+
+def get_video_url(weibo_info):
+    """获取微博普通视频URL"""
+    video_url = ""
+    if weibo_info.get("page_info"):
+        if weibo_info["page_info"].get("type") == "video":
+            media_info = weibo_info["page_info"].get("urls") or weibo_info["page_info"].get("media_info")
+            if media_info:
+                video_url = (media_info.get("mp4_720p_mp4") or
+                             media_info.get("mp4_hd_url") or
+                             media_info.get("hevc_mp4_hd") or
+                             media_info.get("mp4_sd_url") or
+                             media_info.get("mp4_ld_mp4") or
+                             media_info.get("stream_url_hd") or
+                             media_info.get("stream_url"))
+    return video_url
+
+
+# 可以按配置不计算的微博字段，按写入的顺序排列；其余字段（id、用户、时间等）总是计算
+OPTIONAL_FIELDS = (
+    "text",
+    "article_url",
+    "pics",
+    "video_url",
+    "live_photo_url",
+    "location",
+    "attitudes_count",
+    "comments_count",
+    "reposts_count",
+    "topics",
+    "at_users",
+)
+
+
+class FieldExtractor:
+    """按字段名计算一条微博的字段，正文只在第一次需要时解析一次"""
+
+    __slots__ = ("weibo_info", "remove_html_tag", "_entities")
+
+    def __init__(self, weibo_info, remove_html_tag):
+        self.weibo_info = weibo_info
+        self.remove_html_tag = remove_html_tag
+        self._entities = None
+
+    def entities(self):
+        if self._entities is None:
+            # 纯文本正文直接切分，其余正文一次遍历同时取出文本、头条文章、位置、话题和@用户
+            self._entities = parse_entities(self.weibo_info["text"])
+        return self._entities
+
+    def text(self):
+        if not self.remove_html_tag:
+            return self.weibo_info["text"]
+        text_list = self.entities().text_list
+        # 若text_list中的某个字符串元素以 @ 或 # 开始，则将该元素与前后元素合并为新元素，否则会带来没有必要的换行
+        text_list_modified = []
+        for ele in range(len(text_list)):
+            if ele > 0 and (text_list[ele-1].startswith(('@','#')) or text_list[ele].startswith(('@','#'))):
+                text_list_modified[-1] += text_list[ele]
+            else:
+                text_list_modified.append(text_list[ele])
+        return "\n".join(text_list_modified)
+
+    def article_url(self):
+        return self.entities().article_url
+
+    def pics(self):
+        return get_pics(self.weibo_info)
+
+    def video_url(self):
+        return get_video_url(self.weibo_info)  # 普通视频URL
+
+    def live_photo_url(self):
+        return get_live_photo_url(self.weibo_info)  # Live Photo视频URL
+
+    def location(self):
+        return self.entities().location
+
+    def attitudes_count(self):
+        return string_to_int(self.weibo_info.get("attitudes_count", 0))
+
+    def comments_count(self):
+        return string_to_int(self.weibo_info.get("comments_count", 0))
+
+    def reposts_count(self):
+        return string_to_int(self.weibo_info.get("reposts_count", 0))
+
+    def topics(self):
+        return self.entities().topics
+
+    def at_users(self):
+        return self.entities().at_users
+
+
+def parse_weibo(weibo_info, remove_html_tag, fields=None):
+    """把一条微博json解析为WeiboRecord，不做乱码处理
+
+    fields为需要计算的字段集合，为None时计算全部字段；不在其中的字段保持默认值，
+    对应的提取函数（包括正文的html解析）不会执行。
+    """
+    weibo = WeiboRecord()
+    if weibo_info["user"]:
+        weibo["user_id"] = weibo_info["user"]["id"]
+        weibo["screen_name"] = weibo_info["user"]["screen_name"]
+    weibo["id"] = int(weibo_info["id"])
+    weibo["bid"] = weibo_info["bid"]
+    weibo["created_at"] = weibo_info["created_at"]
+    weibo["source"] = weibo_info["source"]
+    extractor = FieldExtractor(weibo_info, remove_html_tag)
+    for name in OPTIONAL_FIELDS:
+        if fields is None or name in fields:
+            weibo[name] = getattr(extractor, name)()
+    return weibo
+
+
+def parse_card(job, remove_html_tag, now=None, fields=None):
+    """解析一条微博及其转发的原微博
+
+    job为Weibo.resolve_card准备好的 (列表页微博json, 长微博全文json, 被转发微博json,
+    被转发长微博全文json, 已缓存的被转发微博)，其中需要请求网络的部分已经在主进程中取得，
+    这里只做解析，可以在子进程中执行。
+    """
+    weibo_info, long_info, retweeted_status, long_retweet_info, retweet = job
+    weibo = parse_weibo(long_info or weibo_info, remove_html_tag, fields).standardize()
+    if retweeted_status:
+        if retweet is None:
+            retweet = parse_weibo(
+                long_retweet_info or retweeted_status, remove_html_tag, fields
+            ).standardize()
+            retweet["created_at"], retweet["full_created_at"] = standardize_date(
+                retweeted_status["created_at"], now
+            )
+        weibo["retweet"] = retweet
+    weibo["created_at"], weibo["full_created_at"] = standardize_date(weibo_info["created_at"], now)
+    return weibo
+
+
+def parse_cards(jobs, remove_html_tag, now=None, fields=None):
+    """按顺序解析一批微博，解析失败的微博对应的结果为None，供进程池调用"""
+    weibos = []
+    for job in jobs:
+        try:
+            weibos.append(parse_card(job, remove_html_tag, now, fields))
+        except Exception as e:
+            logger.exception(e)
+            weibos.append(None)
+    return weibos
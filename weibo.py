@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
 import codecs
 import copy
 import csv
@@ -8,28 +9,55 @@ import json
 import logging
 import logging.config
 import math
+import multiprocessing
 import os
 import random
 import re
-import sqlite3
 import sys
 import warnings
-import webbrowser
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date, datetime, timedelta
+from functools import partial
 from pathlib import Path
 from time import sleep
 
 import requests
 from requests.exceptions import RequestException
-from lxml import etree
 from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
 import const
-from util import csvutil
-from util.dateutil import convert_to_days_ago
+from util.async_crawler import AsyncCrawler
+from util.content_cache import ContentCache
+from util.cookie_pool import CookiePool, get_config_cookies
+from util.crawl_state import CrawlState
+from util.dateutil import DTFORMAT, convert_to_days_ago, normalize_datetime, standardize_date
+from util.html_extract import strip_tags
+from util.http_cache import HttpCache
 from util.notify import push_deer
+from util.quarantine import CrawlBlocked, Quarantine
+from util.ratelimit import RateLimiter, classify_response, get_endpoint
+from util.records import (
+    COMMENT_TABLE,
+    REPOST_TABLE,
+    RETWEET_CSV,
+    USER_CSV_HEADERS,
+    USER_MYSQL_TABLE,
+    USER_SQLITE_TABLE,
+    WEIBO_CSV,
+    WEIBO_TABLE,
+    CommentRecord,
+    RepostRecord,
+    UserRecord,
+    WeiboRecord,
+)
+from util.seen_ids import SeenIds
+from util.sqlite_db import SQLiteDB
+from util.transport import Transport
+from util.weibo_id import normalize_input
+from util.long_text import LongTextFetcher
+from util.weibo_parser import OPTIONAL_FIELDS, parse_card, parse_cards, string_to_int
 from util.llm_analyzer import LLMAnalyzer  # 导入 LLM 分析器
 
 warnings.filterwarnings("ignore")
@@ -38,11 +66,10 @@ warnings.filterwarnings("ignore")
 if not os.path.isdir("log/"):
     os.makedirs("log/")
 logging_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + "logging.conf"
-logging.config.fileConfig(logging_path)
+logging.config.fileConfig(logging_path, disable_existing_loggers=False)
 logger = logging.getLogger("weibo")
 
 # 日期时间格式
-DTFORMAT = "%Y-%m-%dT%H:%M:%S"
 
 class Weibo(object):
     def __init__(self, config):
@@ -97,22 +124,60 @@ class Weibo(object):
         self.user_id_as_folder_name = config.get(
             "user_id_as_folder_name", 0
         )  # 结果目录名，取值为0或1，决定结果文件存储在用户昵称文件夹里还是用户id文件夹里
+        # 解析微博时需要计算的字段，None代表全部计算
+        self.weibo_fields = self.get_weibo_fields(config)
         cookie = config.get("cookie")  # 微博cookie，可填可不填
         user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
         self.headers = {"User_Agent": user_agent, "Cookie": cookie}
+        # 多账号cookie池，每次请求从健康的cookie中轮流选择，兼容只填写cookie的旧配置
+        self.cookie_pool = CookiePool.from_config(config)
+        # 验证码隔离区，遇到验证码的用户稍后重试，不再阻塞等待人工输入
+        # 修改marker_file或在config.json中更换cookie后，隔离的用户会立即重试
+        self.config_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + "config.json"
+        quarantine_config = dict(config.get("captcha_quarantine") or {})
+        marker_file = quarantine_config.get("marker_file") or "weibo/captcha_resolved"
+        if not os.path.isabs(marker_file):
+            marker_file = os.path.split(os.path.realpath(__file__))[0] + os.sep + marker_file
+        quarantine_config["marker_file"] = marker_file
+        self.quarantine = Quarantine(quarantine_config, (marker_file, self.config_path))
         self.mysql_config = config.get("mysql_config")  # MySQL数据库连接配置，可以不填
         self.mongodb_URI = config.get("mongodb_URI")  # MongoDB数据库连接字符串，可以不填
         self.post_config = config.get("post_config")  # post_config，可以不填
         self.page_weibo_count = config.get("page_weibo_count")  # page_weibo_count，爬取一页的微博数，默认10页
         # 新增参数：最大微博获取数量，默认为5
         self.max_weibo_count = config.get("max_weibo_count", 5)
-        # 新增参数：目标bid，如果设置了此参数，则只处理这个bid的微博
+        # 为1时与旧版本一致，每个用户只获取第一页；为0时逐页获取，直到达到max_weibo_count或since_date
+        self.first_page_only = config.get("first_page_only", 0)
+        # 目标bid，设置后只通过statuses/show获取这一条微博，不再抓取用户列表
         self.target_bid = config.get("target_bid", "")
         user_id_list = config["user_id_list"]
         self.session = requests.Session()
         adapter = HTTPAdapter(max_retries=5)
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
+        # 请求录制/回放，record模式保存接口响应，replay模式从本地mock_server.py回放，可以不填
+        self.transport = Transport.from_config(
+            config.get("transport"), os.path.split(os.path.realpath(__file__))[0]
+        )
+        if self.transport:
+            self.transport.mount(self.session)
+        # 请求限速，按接口和cookie分别限制每秒请求数，可在rate_limit中配置
+        # adaptive_throttle为自适应限速（AIMD）参数，正常时逐步提速，被限流时成倍降速
+        self.rate_limiter = RateLimiter(
+            config.get("rate_limit"), config.get("adaptive_throttle")
+        )
+        # 接口响应缓存，短时间内重复请求不会变化的数据时直接使用缓存
+        http_cache_config = config.get("http_cache") or {}
+        self.http_cache = None
+        if http_cache_config.get("enable"):
+            cache_path = http_cache_config.get("path") or "weibo/http_cache.db"
+            if not os.path.isabs(cache_path):
+                cache_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + cache_path
+            self.http_cache = HttpCache(
+                cache_path,
+                http_cache_config.get("max_size_mb", 200),
+                http_cache_config.get("ttl"),
+            )
         # 避免卡住
         if isinstance(user_id_list, list):
             random.shuffle(user_id_list)
@@ -146,9 +211,119 @@ class Weibo(object):
         self.user = {}  # 存储目标微博用户信息
         self.got_count = 0  # 存储爬取到的微博数
         self.weibo = []  # 存储爬取到的所有微博信息
-        self.weibo_id_list = []  # 存储爬取到的所有微博id
-        self.long_sleep_count_before_each_user = 0 #每个用户前的长时间sleep避免被ban
+        self.weibo_ids = set()  # 存储本次运行爬取到的所有微博id
+        self.long_weibo_futures = {}  # 预取中的长微博，键为微博id
+        self.page_now = None  # 当前页解析相对时间的基准时间
+        self.cursor = None  # 已获取微博中最旧的微博id
+        self.newest_id = None  # 已获取微博中最新的微博id
+        self.newest_created_at = None  # 最新微博的发布时间
+        self.high_water_id = None  # append模式下上次运行已经获取到的最新微博id
+        self.resume_range = None  # 从断点继续时，上次运行已经写入的微博id范围
         self.store_binary_in_sqlite = config.get("store_binary_in_sqlite", 0)
+        # weibodata.db的长连接，写入按batch_size行或batch_seconds秒成批提交
+        sqlite_config = config.get("sqlite_config") or {}
+        self.sqlite_db = SQLiteDB(
+            self.get_sqlte_path(),
+            sqlite_config.get("batch_size", 1000),
+            sqlite_config.get("batch_seconds", 2),
+        )
+        # 配置了llm_config时使用LLM分析微博内容
+        self.llm_analyzer = LLMAnalyzer(config) if config.get("llm_config") else None
+        # 同时抓取的用户数，0或1代表逐个用户串行抓取，大于1时使用异步并发抓取
+        # 并发的只有用户信息和微博列表，长微博全文、评论和转发仍在一个写入线程中逐个请求，
+        # 开启download_comment、download_repost时并发带来的提升有限
+        self.async_concurrency = config.get("async_concurrency", 0)
+        # 预取线程数，解析当前页的同时预取下一页和本页的长微博，0代表不预取
+        # 预取的请求同样经过限速器，不会超出请求速率
+        prefetch_workers = config.get("prefetch_workers", 4)
+        # 长微博全文获取器，按微博id缓存最近long_text_cache_size条全文
+        self.long_text_fetcher = LongTextFetcher(self, config.get("long_text_cache_size", 1000))
+        # 被转发原微博的缓存，persist为1时同时保存到SQLite供之后的运行使用
+        content_cache_config = config.get("content_cache") or {}
+        content_cache_path = None
+        if content_cache_config.get("persist"):
+            content_cache_path = content_cache_config.get("path") or "weibo/content_cache.db"
+            if not os.path.isabs(content_cache_path):
+                content_cache_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + content_cache_path
+        self.content_cache = ContentCache(
+            content_cache_config.get("memory_size", 2000),
+            content_cache_path,
+            content_cache_config.get("ttl", 86400),
+        )
+        # 抓取进度和用户状态，每写完一页记录一次，中断后再次运行时从上次写完的页继续
+        # enable为0时只保存在内存中，不能断点续爬
+        crawl_state_config = config.get("crawl_state") or {}
+        crawl_state_path = ":memory:"
+        if crawl_state_config.get("enable", 1):
+            crawl_state_path = crawl_state_config.get("path") or "weibo/crawl_state.db"
+            if not os.path.isabs(crawl_state_path):
+                crawl_state_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + crawl_state_path
+        self.crawl_state = CrawlState(crawl_state_path)
+        self.user_csv_file_path = (
+            os.path.split(os.path.realpath(__file__))[0] + os.sep + "weibo" + os.sep + "users.csv"
+        )
+        self.import_users_csv()
+        # 所有写入过的微博id，append模式下已写入过的微博在解析前直接跳过
+        seen_ids_config = config.get("seen_ids") or {}
+        self.seen_ids = None
+        if seen_ids_config.get("enable", 1):
+            seen_ids_path = seen_ids_config.get("path") or "weibo/seen_ids.bin"
+            if not os.path.isabs(seen_ids_path):
+                seen_ids_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + seen_ids_path
+            self.seen_ids = SeenIds(seen_ids_path)
+        self.prefetch_executor = (
+            ThreadPoolExecutor(max_workers=prefetch_workers) if prefetch_workers > 0 else None
+        )
+        # 解析微博的进程数，大于1时把每页微博的解析放到进程池中，适合回溯大量历史微博；
+        # 0或1代表在当前线程中解析。使用LLM分析时不启用
+        parse_workers = config.get("parse_workers", 0)
+        self.parse_executor = None
+        if parse_workers > 1 and not self.llm_analyzer:
+            # 使用spawn启动子进程，避免fork时复制预取线程持有的锁
+            self.parse_executor = ProcessPoolExecutor(
+                max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        self.parse_workers = parse_workers
+
+    def get_weibo_fields(self, config):
+        """确定解析微博时需要计算的字段
+
+        config.json中的weibo_fields为需要的字段列表，可以不计算的只有article_url、pics、video_url、
+        live_photo_url、location、attitudes_count、comments_count、reposts_count、topics、at_users，
+        id、用户、时间和正文等其他字段总是计算。未配置时按写入方式推断，只写入sqlite/mysql时
+        不计算数据库表中没有的字段（目前只有live_photo_url）。下载图片、视频、评论和转发以及检查
+        cookie所需的字段总是计算。返回None代表计算全部字段。
+        """
+        fields = config.get("weibo_fields")
+        if fields:
+            unknown = [f for f in fields if f not in OPTIONAL_FIELDS]
+            if unknown:
+                logger.warning(
+                    "weibo_fields中的字段%s不存在或不能选择，可以选择的字段为%s，请重新输入",
+                    unknown,
+                    list(OPTIONAL_FIELDS),
+                )
+                sys.exit()
+            fields = set(fields)
+        elif self.write_mode and set(self.write_mode) <= {"sqlite", "mysql"}:
+            fields = set(WEIBO_TABLE.fields)
+        else:
+            return None
+        fields.add("text")
+        if self.download_comment:
+            fields.add("comments_count")
+        if self.download_repost:
+            fields.add("reposts_count")
+        if self.original_pic_download or self.retweet_pic_download:
+            fields.add("pics")
+        if self.original_video_download or self.retweet_video_download:
+            fields.add("video_url")
+        if self.original_live_photo_download or self.retweet_live_photo_download:
+            fields.add("live_photo_url")
+        if fields.issuperset(OPTIONAL_FIELDS):
+            return None
+        return frozenset(fields)
+
     def validate_config(self, config):
         """验证配置是否正确"""
 
@@ -186,8 +361,8 @@ class Weibo(object):
                 )
                 sys.exit()
         # 验证运行模式
-        if "sqlite" not in config["write_mode"] and const.MODE == "append":
-            logger.warning("append模式下请将sqlite加入write_mode中")
+        if const.MODE == "append" and not (config.get("crawl_state") or {}).get("enable", 1):
+            logger.warning("append模式需要记录每个用户的最新微博，请启用crawl_state")
             sys.exit()
 
         # 验证user_id_list
@@ -244,59 +419,65 @@ class Weibo(object):
 
     def get_json(self, params):
         url = "https://m.weibo.cn/api/container/getIndex?"
-        try:
-            r = self.session.get(url, params=params, headers=self.headers, verify=False, timeout=10)
-            r.raise_for_status()
-            response_json = r.json()
-            return response_json, r.status_code
-        except RequestException as e:
-            logger.error(f"请求失败，错误信息：{e}")
-            return {}, 500
-        except ValueError as ve:
-            logger.error(f"JSON 解码失败，错误信息：{ve}")
-            return {}, 500
-
-    def handle_captcha(self, js):
+        js, signal = self.fetch_json(url, params=params, verify=False, timeout=10)
+        return js, 200 if signal == "ok" else 500
+
+    def get_headers(self):
+        """获取本次请求的请求头，cookie从cookie池中选取"""
+        cookie = self.cookie_pool.pick()
+        if cookie is None:
+            return self.headers
+        return dict(self.headers, Cookie=cookie)
+
+    def report_signal(self, url, cookie, signal):
+        """把响应类别反馈给限速器和cookie池"""
+        self.rate_limiter.report(get_endpoint(url), cookie, signal)
+        self.cookie_pool.report(cookie, signal)
+
+    def request(self, url, params=None, **kwargs):
+        """发送GET请求，请求前先从该接口、该cookie对应的令牌桶中获取令牌"""
+        if "headers" not in kwargs:
+            kwargs["headers"] = self.get_headers()
+        headers = kwargs["headers"] or {}
+        self.rate_limiter.acquire(get_endpoint(url), headers.get("Cookie"))
+        return self.session.get(url, params=params, **kwargs)
+
+    def fetch_json(self, url, params=None, ignore_status=(), **kwargs):
         """
-        处理验证码挑战，提示用户手动完成验证。
+        请求json接口，并把响应类别反馈给限速器以自适应调整请求速率。
 
         参数:
-            js (dict): API 返回的 JSON 数据。
+            ignore_status (tuple): 该接口的正常业务状态码，出现时不视为限流，不调整速率。
 
         返回:
-            bool: 如果用户成功完成验证码，返回 True；否则返回 False。
+            tuple: (json字典，失败时为空字典, 响应类别，见ratelimit.classify_response)
         """
-        logger.debug(f"收到的 JSON 数据：{js}")
-        
-        captcha_url = js.get("url")
-        if captcha_url:
-            logger.warning("检测到验证码挑战。正在打开验证码页面以供手动验证。")
-            webbrowser.open(captcha_url)
-        else:
-            logger.warning("检测到可能的验证码挑战，但未提供验证码 URL。请手动检查浏览器并完成验证码验证。")
-            return False
-        
-        logger.info("请在打开的浏览器窗口中完成验证码验证。")
-        while True:
-            try:
-                # 等待用户输入
-                user_input = input("完成验证码后，请输入 'y' 继续，或输入 'q' 退出：").strip().lower()
-
-                if user_input == 'y':
-                    logger.info("用户输入 'y'，继续爬取。")
-                    return True
-                elif user_input == 'q':
-                    logger.warning("用户选择退出，程序中止。")
-                    sys.exit("用户选择退出，程序中止。")
-                else:
-                    logger.warning("无效输入，请重新输入 'y' 或 'q'。")
-            except EOFError:
-                logger.error("读取用户输入时发生 EOFError，程序退出。")
-                sys.exit("输入流已关闭，程序中止。")
-    
-    def get_weibo_json(self, page):
-        """获取网页中微博json数据"""
-        url = "https://m.weibo.cn/api/container/getIndex?"
+        if "headers" not in kwargs:
+            kwargs["headers"] = self.get_headers()
+        headers = kwargs["headers"] or {}
+        if self.http_cache:
+            cached = self.http_cache.get(url, params, headers.get("Cookie"))
+            if cached is not None:
+                return json.loads(cached), "ok"
+        status_code = None
+        js = None
+        try:
+            response = self.request(url, params=params, **kwargs)
+            status_code = response.status_code
+            js = response.json()
+        except RequestException as e:
+            logger.error(f"请求失败，错误信息：{e}")
+        except ValueError as ve:
+            logger.error(f"JSON 解码失败，错误信息：{ve}")
+        signal = classify_response(status_code, js)
+        if status_code not in ignore_status:
+            self.report_signal(url, headers.get("Cookie"), signal)
+        if signal == "ok" and self.http_cache:
+            self.http_cache.set(url, params, response.text, headers.get("Cookie"))
+        return (js if isinstance(js, dict) else {}), signal
+
+    def get_weibo_params(self, page):
+        """获取某一页微博的请求参数"""
         params = (
             {
                 "container_ext": "profile_uid:" + str(self.user_config["user_id"]),
@@ -308,91 +489,79 @@ class Weibo(object):
         )
         params["page"] = page
         params["count"] = self.page_weibo_count
+        return params
+
+    def get_weibo_json(self, page):
+        """获取网页中微博json数据，被验证码阻断或多次重试仍失败时抛出CrawlBlocked"""
+        url = "https://m.weibo.cn/api/container/getIndex?"
+        params = self.get_weibo_params(page)
         max_retries = 5
         retries = 0
-        backoff_factor = 5
 
+        # 失败后的等待由限速器负责：出现限流迹象时该接口的速率会成倍下降
         while retries < max_retries:
-            try:
-                response = self.session.get(url, params=params, headers=self.headers, timeout=10)
-                response.raise_for_status()  # 如果响应状态码不是 200，会抛出 HTTPError
-                js = response.json()
-                if 'data' in js:
-                    logger.info(f"成功获取到页面 {page} 的数据。")
-                    return js
-                else:
-                    logger.warning("未能获取到数据，可能需要验证码验证。")
-                    if self.handle_captcha(js):
-                        logger.info("用户已完成验证码验证，继续请求数据。")
-                        retries = 0  # 重置重试计数器
-                        continue
-                    else:
-                        logger.error("验证码验证失败或未完成，程序将退出。")
-                        sys.exit()
-            except RequestException as e:
-                retries += 1
-                sleep_time = backoff_factor * (2 ** retries)
-                logger.error(f"请求失败，错误信息：{e}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
-            except ValueError as ve:
+            js, signal = self.fetch_json(url, params=params, timeout=10)
+            if signal == "ok":
+                logger.info(f"成功获取到页面 {page} 的数据。")
+                return js
+            if signal == "captcha" and self.cookie_pool.has_available():
                 retries += 1
-                sleep_time = backoff_factor * (2 ** retries)
-                logger.error(f"JSON 解码失败，错误信息：{ve}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
-        logger.error("超过最大重试次数，跳过当前页面。")
-        return {}
+                logger.warning("未能获取到数据，需要验证码验证，换用其他cookie重试。")
+                continue
+            if signal == "captcha":
+                # 不再阻塞等待人工输入，交给隔离区稍后重试，其他用户继续抓取
+                raise CrawlBlocked("验证码", js.get("url"), page)
+            retries += 1
+            logger.warning(f"未能获取到页面 {page} 的数据（{signal}），降低请求速率后重试...")
+        # 不能当作没有更多微博处理，否则会标记抓取完毕并提高最新微博记录，未获取的微博再也不会抓取
+        logger.error("超过最大重试次数，稍后从第%d页重试该用户。", page)
+        raise CrawlBlocked("持续限流", page=page)
     
-    def user_to_csv(self):
-        """将爬取到的用户信息写入csv文件"""
-        file_dir = os.path.split(os.path.realpath(__file__))[0] + os.sep + "weibo"
+    def import_users_csv(self):
+        """用户状态为空时从旧版本生成的users.csv导入用户信息，导出时不会丢失以前的用户"""
+        if self.crawl_state.count_users() or not os.path.isfile(self.user_csv_file_path):
+            return
+        with open(self.user_csv_file_path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.reader(f))
+        for row in rows[1:]:
+            if len(row) < len(UserRecord.FIELDS):
+                continue
+            user = UserRecord.from_dict(dict(zip(UserRecord.FIELDS, row)))
+            self.crawl_state.save_user(user["id"], user["screen_name"], user.to_dict())
+        logger.info("已从%s导入%d个用户的信息", self.user_csv_file_path, self.crawl_state.count_users())
+
+    def user_to_state(self):
+        """保存用户信息，users.csv在运行结束时统一导出"""
+        self.crawl_state.save_user(self.user["id"], self.user["screen_name"], self.user.to_dict())
+
+    def export_users_csv(self):
+        """把全部用户的信息和最新微博导出到users.csv"""
+        users = self.crawl_state.get_users()
+        if not users:
+            return
+        file_dir = os.path.dirname(self.user_csv_file_path)
         if not os.path.isdir(file_dir):
             os.makedirs(file_dir)
-        file_path = file_dir + os.sep + "users.csv"
-        self.user_csv_file_path = file_path
-        result_headers = [
-            "用户id",
-            "昵称",
-            "性别",
-            "生日",
-            "所在地",
-            "学习经历",
-            "公司",
-            "注册时间",
-            "阳光信用",
-            "微博数",
-            "粉丝数",
-            "关注数",
-            "简介",
-            "主页",
-            "头像",
-            "高清头像",
-            "微博等级",
-            "会员等级",
-            "是否认证",
-            "认证类型",
-            "认证信息",
-            "上次记录微博信息",
-        ]
-        result_data = [
-            [
-                v.encode("utf-8") if "unicode" in str(type(v)) else v
-                for v in self.user.values()
-            ]
-        ]
-        # 已经插入信息的用户无需重复插入，返回的id是空字符串或微博id 发布日期%Y-%m-%d
-        last_weibo_msg = csvutil.insert_or_update_user(
-            logger, result_headers, result_data, file_path
-        )
-        self.last_weibo_id = last_weibo_msg.split(" ")[0] if last_weibo_msg else ""
-        self.last_weibo_date = (
-            last_weibo_msg.split(" ")[1]
-            if last_weibo_msg
-            else self.user_config["since_date"]
-        )
+        result_headers = list(USER_CSV_HEADERS) + ["上次记录微博信息"]
+        tmp_path = self.user_csv_file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(result_headers)
+            for user_info, high_water in users:
+                # 最后一列为最新微博的id和发布日期
+                last_weibo_msg = ""
+                if high_water:
+                    last_weibo_msg = "{} {}".format(
+                        high_water.newest_id, (high_water.newest_created_at or "")[:10]
+                    ).strip()
+                writer.writerow(UserRecord.from_dict(user_info).values() + [last_weibo_msg])
+        os.replace(tmp_path, self.user_csv_file_path)
+        logger.info("%d个用户的信息写入csv文件完毕，保存路径:", len(users))
+        logger.info(self.user_csv_file_path)
 
     def user_to_mongodb(self):
         """将爬取的用户信息写入MongoDB数据库"""
-        user_list = [self.user]
+        user_list = [self.user.to_dict()]
         self.info_to_mongodb("user", user_list)
         logger.info("%s信息写入MongoDB数据库完毕", self.user["screen_name"])
 
@@ -436,12 +605,17 @@ class Weibo(object):
                 PRIMARY KEY (id)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
         self.mysql_create_table(mysql_config, create_table)
-        self.mysql_insert(mysql_config, "user", [self.user])
+        self.mysql_insert(
+            mysql_config,
+            "user",
+            USER_MYSQL_TABLE.columns,
+            [USER_MYSQL_TABLE.row(self.user)],
+        )
         logger.info("%s信息写入MySQL数据库完毕", self.user["screen_name"])
 
     def user_to_database(self):
         """将用户信息写入文件/数据库"""
-        self.user_to_csv()
+        self.user_to_state()
         if "mysql" in self.write_mode:
             self.user_to_mysql()
         if "mongo" in self.write_mode:
@@ -449,152 +623,125 @@ class Weibo(object):
         if "sqlite" in self.write_mode:
             self.user_to_sqlite()
 
+    def get_user_info_params(self):
+        """获取用户详细资料卡片的请求参数"""
+        return {"containerid": "230283" + str(self.user_config["user_id"]) + "_-_INFO"}
+
+    def build_user_info(self, info, info_js):
+        """根据用户主页信息和资料卡片构造标准化的用户信息"""
+        user_info = UserRecord()
+        user_info["id"] = self.user_config["user_id"]
+        user_info["screen_name"] = info.get("screen_name", "")
+        user_info["gender"] = info.get("gender", "")
+        zh_list = ["生日", "所在地", "小学", "初中", "高中", "大学", "公司", "注册时间", "阳光信用"]
+        en_list = [
+            "birthday",
+            "location",
+            "education",
+            "education",
+            "education",
+            "education",
+            "company",
+            "registration_time",
+            "sunshine",
+        ]
+        if info_js.get("ok") and "data" in info_js:
+            cards = info_js["data"]["cards"]
+            if isinstance(cards, list) and len(cards) > 1:
+                card_list = cards[0]["card_group"] + cards[1]["card_group"]
+                for card in card_list:
+                    if card.get("item_name") in zh_list:
+                        user_info[
+                            en_list[zh_list.index(card.get("item_name"))]
+                        ] = card.get("item_content", "")
+        user_info["statuses_count"] = string_to_int(
+            info.get("statuses_count", 0)
+        )
+        user_info["followers_count"] = string_to_int(
+            info.get("followers_count", 0)
+        )
+        user_info["follow_count"] = string_to_int(info.get("follow_count", 0))
+        user_info["description"] = info.get("description", "")
+        user_info["profile_url"] = info.get("profile_url", "")
+        user_info["profile_image_url"] = info.get("profile_image_url", "")
+        user_info["avatar_hd"] = info.get("avatar_hd", "")
+        user_info["urank"] = info.get("urank", 0)
+        user_info["mbrank"] = info.get("mbrank", 0)
+        user_info["verified"] = info.get("verified", False)
+        user_info["verified_type"] = info.get("verified_type", -1)
+        user_info["verified_reason"] = info.get("verified_reason", "")
+        return user_info.standardize()
+
     def get_user_info(self):
         """获取用户信息"""
         params = {"containerid": "100505" + str(self.user_config["user_id"])}
         url = "https://m.weibo.cn/api/container/getIndex"
-        
-        # 这里在读取下一个用户的时候很容易被ban，需要优化休眠时长
-        # 加一个count，不需要一上来啥都没干就sleep
-        if self.long_sleep_count_before_each_user > 0:
-            sleep_time = random.randint(30, 60)
-            # 添加log，否则一般用户不知道以为程序卡了
-            logger.info(f"""短暂sleep {sleep_time}秒，避免被ban""")        
-            sleep(sleep_time)
-            logger.info("sleep结束")  
-        self.long_sleep_count_before_each_user = self.long_sleep_count_before_each_user + 1      
+
 
         max_retries = 5  # 设置最大重试次数，避免无限循环
         retries = 0
-        backoff_factor = 5  # 指数退避的基数（秒）
-        
+
+        # 失败后的等待由限速器负责：出现限流迹象时该接口的速率会成倍下降
         while retries < max_retries:
-            try:
-                response = self.session.get(url, params=params, headers=self.headers, timeout=10)
-                response.raise_for_status()
-                js = response.json()
-                if 'data' in js and 'userInfo' in js['data']:
-                    info = js["data"]["userInfo"]
-                    user_info = OrderedDict()
-                    user_info["id"] = self.user_config["user_id"]
-                    user_info["screen_name"] = info.get("screen_name", "")
-                    user_info["gender"] = info.get("gender", "")
-                    params = {
-                        "containerid": "230283" + str(self.user_config["user_id"]) + "_-_INFO"
-                    }
-                    zh_list = ["生日", "所在地", "小学", "初中", "高中", "大学", "公司", "注册时间", "阳光信用"]
-                    en_list = [
-                        "birthday",
-                        "location",
-                        "education",
-                        "education",
-                        "education",
-                        "education",
-                        "company",
-                        "registration_time",
-                        "sunshine",
-                    ]
-                    for i in en_list:
-                        user_info[i] = ""
-                    js, _ = self.get_json(params)
-                    if js["ok"]:
-                        cards = js["data"]["cards"]
-                        if isinstance(cards, list) and len(cards) > 1:
-                            card_list = cards[0]["card_group"] + cards[1]["card_group"]
-                            for card in card_list:
-                                if card.get("item_name") in zh_list:
-                                    user_info[
-                                        en_list[zh_list.index(card.get("item_name"))]
-                                    ] = card.get("item_content", "")
-                    user_info["statuses_count"] = self.string_to_int(
-                        info.get("statuses_count", 0)
-                    )
-                    user_info["followers_count"] = self.string_to_int(
-                        info.get("followers_count", 0)
-                    )
-                    user_info["follow_count"] = self.string_to_int(info.get("follow_count", 0))
-                    user_info["description"] = info.get("description", "")
-                    user_info["profile_url"] = info.get("profile_url", "")
-                    user_info["profile_image_url"] = info.get("profile_image_url", "")
-                    user_info["avatar_hd"] = info.get("avatar_hd", "")
-                    user_info["urank"] = info.get("urank", 0)
-                    user_info["mbrank"] = info.get("mbrank", 0)
-                    user_info["verified"] = info.get("verified", False)
-                    user_info["verified_type"] = info.get("verified_type", -1)
-                    user_info["verified_reason"] = info.get("verified_reason", "")
-                    self.user = self.standardize_info(user_info)
-                    self.user_to_database()
-                    logger.info(f"成功获取到用户 {self.user_config['user_id']} 的信息。")
-                    return 0
-                else:
-                    logger.warning("未能获取到用户信息，可能需要验证码验证。")
-                    if self.handle_captcha(js):
-                        logger.info("用户已完成验证码验证，继续请求用户信息。")
-                        retries = 0  # 重置重试计数器
-                        continue
-                    else:
-                        logger.error("验证码验证失败或未完成，程序将退出。")
-                        sys.exit()
-            except RequestException as e:
-                retries += 1
-                sleep_time = backoff_factor * (2 ** retries)
-                logger.error(f"请求失败，错误信息：{e}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
-            except ValueError as ve:
+            js, signal = self.fetch_json(url, params=params, timeout=10)
+            if signal == "ok":
+                info = js["data"].get("userInfo") if isinstance(js["data"], dict) else None
+                if not info:
+                    logger.warning(f"未能获取到用户 {self.user_config['user_id']} 的信息，请确认user_id是否正确。")
+                    return -1
+                info_js, info_signal = self.fetch_json(url, params=self.get_user_info_params(), timeout=10)
+                if info_signal == "captcha":
+                    raise CrawlBlocked("验证码", info_js.get("url"))
+                self.user = self.build_user_info(info, info_js)
+                self.user_to_database()
+                logger.info(f"成功获取到用户 {self.user_config['user_id']} 的信息。")
+                return 0
+            if signal == "captcha" and self.cookie_pool.has_available():
                 retries += 1
-                sleep_time = backoff_factor * (2 ** retries)
-                logger.error(f"JSON 解码失败，错误信息：{ve}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
-        logger.error("超过最大重试次数，程序将退出。")
-        sys.exit("超过最大重试次数，程序已退出。")
-
-    def get_long_weibo(self, id):
-        """获取长微博"""
-        url = "https://m.weibo.cn/detail/%s" % id
-        logger.info(f"""URL: {url} """)
-        for i in range(5):
-            sleep(random.uniform(1.0, 2.5))
-            html = self.session.get(url, headers=self.headers, verify=False).text
-            html = html[html.find('"status":') :]
-            html = html[: html.rfind('"call"')]
-            html = html[: html.rfind(",")]
-            html = "{" + html + "}"
-            js = json.loads(html, strict=False)
-            weibo_info = js.get("status")
-            if weibo_info:
-                weibo = self.parse_weibo(weibo_info)
-                return weibo
-
-    def get_pics(self, weibo_info):
-        """获取微博原始图片url"""
-        if weibo_info.get("pics"):
-            pic_info = weibo_info["pics"]
-            pic_list = [pic["large"]["url"] for pic in pic_info]
-            pics = ",".join(pic_list)
-        else:
-            pics = ""
-        return pics
-
-
-    def get_live_photo_url(self, weibo_info):
-        """获取Live Photo视频URL"""
-        live_photo_list = weibo_info.get("live_photo", [])
-        return ";".join(live_photo_list) if live_photo_list else ""
-    def get_video_url(self, weibo_info):
-        """获取微博普通视频URL"""
-        video_url = ""
-        if weibo_info.get("page_info"):
-            if weibo_info["page_info"].get("type") == "video":
-                media_info = weibo_info["page_info"].get("urls") or weibo_info["page_info"].get("media_info")
-                if media_info:
-                    video_url = (media_info.get("mp4_720p_mp4") or
-                                media_info.get("mp4_hd_url") or
-                                media_info.get("hevc_mp4_hd") or
-                                media_info.get("mp4_sd_url") or
-                                media_info.get("mp4_ld_mp4") or
-                                media_info.get("stream_url_hd") or
-                                media_info.get("stream_url"))
-        return video_url
+                logger.warning("未能获取到用户信息，需要验证码验证，换用其他cookie重试。")
+                continue
+            if signal == "captcha":
+                raise CrawlBlocked("验证码", js.get("url"))
+            retries += 1
+            logger.warning(f"未能获取到用户信息（{signal}），降低请求速率后重试...")
+        logger.error("超过最大重试次数，稍后重试该用户。")
+        raise CrawlBlocked("持续限流")
+
+    def get_long_info(self, id, weibo_info=None):
+        """获取长微博的完整json，优先使用预取的结果；weibo_info为列表页中该微博的json"""
+        future = self.long_weibo_futures.pop(id, None)
+        return future.result() if future else self.long_text_fetcher.fetch(id, weibo_info)
+
+    def prefetch_long_weibos(self, cards):
+        """在预取线程中并发请求本页需要的长微博，只预取还在数量限制内的微博"""
+        if not self.prefetch_executor:
+            return
+        remaining = self.max_weibo_count - self.got_count
+        for w in cards:
+            if remaining <= 0:
+                break
+            if w.get("card_type") == 11:
+                w = (w.get("card_group") or [w])[0] or w
+            if w.get("card_type") != 9 or "mblog" not in w:
+                continue
+            remaining -= 1
+            weibo_info = w["mblog"]
+            infos = []
+            if (weibo_info.get("pic_num") or 0) > 9 or weibo_info.get("isLongText"):
+                infos.append(weibo_info)
+            retweeted_status = weibo_info.get("retweeted_status")
+            if (
+                retweeted_status
+                and retweeted_status.get("id")
+                and retweeted_status.get("isLongText")
+                and self.content_cache_key(retweeted_status["id"]) not in self.content_cache
+            ):
+                infos.append(retweeted_status)
+            for info in infos:
+                if info["id"] not in self.long_weibo_futures:
+                    self.long_weibo_futures[info["id"]] = self.prefetch_executor.submit(
+                        self.long_text_fetcher.fetch, info["id"], info
+                    )
 
     def download_one_file(self, url, file_path, type, weibo_id):
         """下载单个文件(图片/视频)"""
@@ -709,19 +856,12 @@ class Weibo(object):
                 f.write(error_entry.encode(sys.stdout.encoding))
             logger.exception(e)
 
-    def sqlite_exist_file(self, url):
-        if not os.path.exists(self.get_sqlte_path()):
+    def sqlite_exist_file(self, file_path):
+        """文件是否已经保存在bins表中，按本地路径查找，使用idx_bins_path_url索引"""
+        if not self.sqlite_db.exists():
             return True
-        con = self.get_sqlite_connection()
-        cur = con.cursor()
-
         query_sql = """SELECT url FROM bins WHERE path=? """
-        count = cur.execute(query_sql, (url,)).fetchone()
-        con.close()
-        if count is None:
-            return False
-
-        return True
+        return bool(self.sqlite_db.query(query_sql, (file_path,)))
 
     def insert_file_sqlite(self, file_path, weibo_id, url, binary):
         if not weibo_id:
@@ -741,9 +881,7 @@ class Weibo(object):
         file_data["path"] = file_path
         file_data["url"] = url
 
-        con = self.get_sqlite_connection()
-        self.sqlite_insert(con, file_data, "bins")
-        con.close()
+        self.sqlite_insert(file_data, "bins")
 
     def handle_download(self, file_type, file_dir, urls, w):
         """处理下载相关操作"""
@@ -842,151 +980,6 @@ class Weibo(object):
         except Exception as e:
             logger.exception(e)
 
-    def get_location(self, selector):
-        """获取微博发布位置"""
-        location_icon = "timeline_card_small_location_default.png"
-        span_list = selector.xpath("//span")
-        location = ""
-        for i, span in enumerate(span_list):
-            if span.xpath("img/@src"):
-                if location_icon in span.xpath("img/@src")[0]:
-                    location = span_list[i + 1].xpath("string(.)")
-                    break
-        return location
-
-    def get_article_url(self, selector):
-        """获取微博中头条文章的url"""
-        article_url = ""
-        text = selector.xpath("string(.)")
-        if text.startswith("发布了头条文章"):
-            url = selector.xpath("//a/@data-url")
-            if url and url[0].startswith("http://t.cn"):
-                article_url = url[0]
-        return article_url
-
-    def get_topics(self, selector):
-        """获取参与的微博话题"""
-        span_list = selector.xpath("//span[@class='surl-text']")
-        topics = ""
-        topic_list = []
-        for span in span_list:
-            text = span.xpath("string(.)")
-            if len(text) > 2 and text[0] == "#" and text[-1] == "#":
-                topic_list.append(text[1:-1])
-        if topic_list:
-            topics = ",".join(topic_list)
-        return topics
-
-    def get_at_users(self, selector):
-        """获取@用户"""
-        a_list = selector.xpath("//a")
-        at_users = ""
-        at_list = []
-        for a in a_list:
-            if "@" + a.xpath("@href")[0][3:] == a.xpath("string(.)"):
-                at_list.append(a.xpath("string(.)")[1:])
-        if at_list:
-            at_users = ",".join(at_list)
-        return at_users
-
-    def string_to_int(self, string):
-        """字符串转换为整数"""
-        if isinstance(string, int):
-            return string
-        elif string.endswith("万+"):
-            string = string[:-2] + "0000"
-        elif string.endswith("万"):
-            string = float(string[:-1]) * 10000
-        elif string.endswith("亿"):
-            string = float(string[:-1]) * 100000000
-        return int(string)
-
-    def standardize_date(self, created_at):
-        """标准化微博发布时间"""
-        if "刚刚" in created_at:
-            ts = datetime.now()
-        elif "分钟" in created_at:
-            minute = created_at[: created_at.find("分钟")]
-            minute = timedelta(minutes=int(minute))
-            ts = datetime.now() - minute
-        elif "小时" in created_at:
-            hour = created_at[: created_at.find("小时")]
-            hour = timedelta(hours=int(hour))
-            ts = datetime.now() - hour
-        elif "昨天" in created_at:
-            day = timedelta(days=1)
-            ts = datetime.now() - day
-        else:
-            created_at = created_at.replace("+0800 ", "")
-            ts = datetime.strptime(created_at, "%c")
-
-        created_at = ts.strftime(DTFORMAT)
-        full_created_at = ts.strftime("%Y-%m-%d %H:%M:%S")
-        return created_at, full_created_at
-
-    def standardize_info(self, weibo):
-        """标准化信息，去除乱码"""
-        for k, v in weibo.items():
-            if (
-                "bool" not in str(type(v))
-                and "int" not in str(type(v))
-                and "list" not in str(type(v))
-                and "long" not in str(type(v))
-            ):
-                weibo[k] = (
-                    v.replace("\u200b", "")
-                    .encode(sys.stdout.encoding, "ignore")
-                    .decode(sys.stdout.encoding)
-                )
-        return weibo
-
-    def parse_weibo(self, weibo_info):
-        weibo = OrderedDict()
-        if weibo_info["user"]:
-            weibo["user_id"] = weibo_info["user"]["id"]
-            weibo["screen_name"] = weibo_info["user"]["screen_name"]
-        else:
-            weibo["user_id"] = ""
-            weibo["screen_name"] = ""
-        weibo["id"] = int(weibo_info["id"])
-        weibo["bid"] = weibo_info["bid"]
-        text_body = weibo_info["text"]
-        selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
-        if self.remove_html_tag:
-            text_list = selector.xpath("//text()")
-            # 若text_list中的某个字符串元素以 @ 或 # 开始，则将该元素与前后元素合并为新元素，否则会带来没有必要的换行
-            text_list_modified = []
-            for ele in range(len(text_list)):
-                if ele > 0 and (text_list[ele-1].startswith(('@','#')) or text_list[ele].startswith(('@','#'))):
-                    text_list_modified[-1] += text_list[ele]
-                else:
-                    text_list_modified.append(text_list[ele])
-            weibo["text"] = "\n".join(text_list_modified)
-        else:
-            weibo["text"] = text_body
-        weibo["article_url"] = self.get_article_url(selector)
-        weibo["pics"] = self.get_pics(weibo_info)
-        weibo["video_url"] = self.get_video_url(weibo_info)  # 普通视频URL
-        weibo["live_photo_url"] = self.get_live_photo_url(weibo_info)  # Live Photo视频URL
-        weibo["location"] = self.get_location(selector)
-        weibo["created_at"] = weibo_info["created_at"]
-        weibo["source"] = weibo_info["source"]
-        weibo["attitudes_count"] = self.string_to_int(
-            weibo_info.get("attitudes_count", 0)
-        )
-        weibo["comments_count"] = self.string_to_int(
-            weibo_info.get("comments_count", 0)
-        )
-        weibo["reposts_count"] = self.string_to_int(weibo_info.get("reposts_count", 0))
-        weibo["topics"] = self.get_topics(selector)
-        weibo["at_users"] = self.get_at_users(selector)
-        
-        # 使用 LLM 分析微博内容
-        if self.llm_analyzer:
-            weibo = self.llm_analyzer.analyze_weibo(weibo)
-            logger.info("完整分析结果：\n%s", json.dumps(weibo, ensure_ascii=False, indent=2))
-        return self.standardize_info(weibo)
-
     def print_user_info(self):
         """打印用户信息"""
         logger.info("+" * 100)
@@ -1039,49 +1032,100 @@ class Weibo(object):
         self.print_one_weibo(weibo)
         logger.info("-" * 120)
 
+    def resolve_card(self, info):
+        """准备解析一条微博需要的全部json：长微博换成全文，被转发的原微博优先使用缓存
+
+        需要请求网络的部分都在这里完成，返回值交给parse_card解析。
+        """
+        weibo_info = info["mblog"]
+        is_long = (weibo_info.get("pic_num") or 0) > 9 or weibo_info.get("isLongText")
+        long_info = self.get_long_info(weibo_info["id"], weibo_info) if is_long else None
+        retweeted_status = weibo_info.get("retweeted_status")
+        long_retweet_info = retweet = None
+        if retweeted_status and retweeted_status.get("id"):  # 转发
+            # 同一条原微博被多次转发时直接使用缓存，不再请求和解析
+            retweet = self.content_cache.get(self.content_cache_key(retweeted_status["id"]))
+            if retweet is not None:
+                retweet = WeiboRecord.from_dict(retweet)
+            elif retweeted_status.get("isLongText"):
+                long_retweet_info = self.get_long_info(retweeted_status["id"], retweeted_status)
+        else:  # 原创
+            retweeted_status = None
+        return weibo_info, long_info, retweeted_status, long_retweet_info, retweet
+
+    def content_cache_key(self, id):
+        """被转发原微博在缓存中的键
+
+        按weibo_fields只计算了部分字段时在id后加上字段集合，持久化的缓存中少了字段的原微博
+        不会被之后计算全部字段的运行取出。
+        """
+        if self.weibo_fields is None:
+            return str(id)
+        return "{}:{}".format(id, ",".join(sorted(self.weibo_fields)))
+
+    def finish_card(self, job, weibo):
+        """解析完成后的处理：按配置使用LLM分析，并缓存新解析的被转发原微博"""
+        new_retweet = weibo.get("retweet") if job[4] is None else None
+        if self.llm_analyzer:
+            for w in (weibo, new_retweet):
+                if w is not None:
+                    self.llm_analyzer.analyze_weibo(w)
+                    logger.info("完整分析结果：\n%s", json.dumps(w.to_dict(), ensure_ascii=False, indent=2))
+        if new_retweet is not None:
+            self.content_cache.set(self.content_cache_key(new_retweet["id"]), new_retweet.to_dict())
+        return weibo
+
     def get_one_weibo(self, info):
         """获取一条微博的全部信息"""
         try:
-            weibo_info = info["mblog"]
-            weibo_id = weibo_info["id"]
-            retweeted_status = weibo_info.get("retweeted_status")
-            is_long = (
-                True if weibo_info.get("pic_num") > 9 else weibo_info.get("isLongText")
-            )
-            if retweeted_status and retweeted_status.get("id"):  # 转发
-                retweet_id = retweeted_status.get("id")
-                is_long_retweet = retweeted_status.get("isLongText")
-                if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
-                    if not weibo:
-                        weibo = self.parse_weibo(weibo_info)
-                else:
-                    weibo = self.parse_weibo(weibo_info)
-                if is_long_retweet:
-                    retweet = self.get_long_weibo(retweet_id)
-                    if not retweet:
-                        retweet = self.parse_weibo(retweeted_status)
-                else:
-                    retweet = self.parse_weibo(retweeted_status)
-                (
-                    retweet["created_at"],
-                    retweet["full_created_at"],
-                ) = self.standardize_date(retweeted_status["created_at"])
-                weibo["retweet"] = retweet
-            else:  # 原创
-                if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
-                    if not weibo:
-                        weibo = self.parse_weibo(weibo_info)
-                else:
-                    weibo = self.parse_weibo(weibo_info)
-            weibo["created_at"], weibo["full_created_at"] = self.standardize_date(
-                weibo_info["created_at"]
-            )
-            return weibo
+            job = self.resolve_card(info)
+            weibo = parse_card(job, self.remove_html_tag, self.page_now, self.weibo_fields)
+            return self.finish_card(job, weibo)
         except Exception as e:
             logger.exception(e)
 
+    def parse_cards_in_pool(self, cards):
+        """使用进程池解析本页的微博，返回 {id(card): 微博}，未启用进程池时返回空字典
+
+        只解析还在数量限制内的微博，其余的微博（以及准备json时出错的微博）
+        仍在parse_one_page中逐条解析，因此页内顺序和since_date的提前结束都不受影响。
+        """
+        if not self.parse_executor:
+            return {}
+        remaining = self.max_weibo_count - self.got_count
+        keys, jobs = [], []
+        for w in cards:
+            if len(jobs) >= remaining:
+                break
+            if w.get("card_type") == 11:
+                w = (w.get("card_group") or [w])[0] or w
+            if w.get("card_type") != 9:
+                continue
+            try:
+                jobs.append(self.resolve_card(w))
+            except Exception:
+                continue
+            keys.append(id(w))
+        if not jobs:
+            return {}
+        # 每个进程解析连续的一段，结果按原来的顺序拼接
+        size = int(math.ceil(len(jobs) / float(self.parse_workers)))
+        chunks = [jobs[i : i + size] for i in range(0, len(jobs), size)]
+        results = self.parse_executor.map(
+            partial(
+                parse_cards,
+                remove_html_tag=self.remove_html_tag,
+                now=self.page_now,
+                fields=self.weibo_fields,
+            ),
+            chunks,
+        )
+        weibos = [weibo for chunk in results for weibo in chunk]
+        return {
+            key: self.finish_card(job, weibo) if weibo else None
+            for key, job, weibo in zip(keys, jobs, weibos)
+        }
+
     def get_weibo_comments(self, weibo, max_count, on_downloaded):
         """
         :weibo standardlized weibo
@@ -1128,21 +1172,11 @@ class Weibo(object):
         if max_id:
             params["max_id"] = max_id
         url = "https://m.weibo.cn/comments/hotflow?max_id_type=0"
-        req = self.session.get(
-            url,
-            params=params,
-            headers=self.headers,
-        )
-        json = None
-        error = False
-        try:
-            json = req.json()
-        except Exception as e:
-            # 没有cookie会抓取失败
-            # 微博日期小于某个日期的用这个url会被403 需要用老办法尝试一下
-            error = True
+        # 没有cookie会抓取失败
+        # 微博日期小于某个日期的用这个url会被403 需要用老办法尝试一下，因此403不视为限流
+        json, signal = self.fetch_json(url, params=params, ignore_status=(403,))
 
-        if error:
+        if signal in ("decode_error", "error", "throttled"):
             # 最大好像只能有50条 TODO: improvement
             self._get_weibo_comments_nocookie(weibo, 0, max_count, 1, on_downloaded)
             return
@@ -1162,10 +1196,6 @@ class Weibo(object):
         if on_downloaded:
             on_downloaded(weibo, comments)
 
-        # 随机睡眠一下
-        if max_count % 40 == 0:
-            sleep(random.randint(1, 5))
-
         cur_count += count
         max_id = data.get("max_id")
 
@@ -1192,11 +1222,8 @@ class Weibo(object):
         url = "https://m.weibo.cn/api/comments/show?id={id}&page={page}".format(
             id=id, page=page
         )
-        req = self.session.get(url)
-        json = None
-        try:
-            json = req.json()
-        except Exception as e:
+        json, signal = self.fetch_json(url, headers=None)
+        if signal in ("decode_error", "error", "throttled"):
             logger.warning("未能抓取完整评论 微博id: {id}".format(id=id))
             return
 
@@ -1215,10 +1242,6 @@ class Weibo(object):
         cur_count += count
         page += 1
 
-        # 随机睡眠一下
-        if page % 2 == 0:
-            sleep(random.randint(1, 5))
-
         req_page = data.get("max")
 
         if req_page == 0:
@@ -1245,16 +1268,8 @@ class Weibo(object):
         id = weibo["id"]
         url = "https://m.weibo.cn/api/statuses/repostTimeline"
         params = {"id": id, "page": page}
-        req = self.session.get(
-            url,
-            params=params,
-            headers=self.headers,
-        )
-
-        json = None
-        try:
-            json = req.json()
-        except Exception as e:
+        json, signal = self.fetch_json(url, params=params)
+        if signal in ("decode_error", "error", "throttled"):
             logger.warning(
                 "未能抓取完整转发 微博id: {id}".format(id=id)
             )
@@ -1275,10 +1290,6 @@ class Weibo(object):
         cur_count += count
         page += 1
 
-        # 随机睡眠一下
-        if page % 2 == 0:
-            sleep(random.randint(2, 5))
-
         req_page = data.get("max")
 
         if req_page == 0:
@@ -1298,15 +1309,89 @@ class Weibo(object):
             return False
     
 
+    def need_next_page(self, js, page):
+        """判断是否预取下一页
+
+        只有本页一定不是最后一页时才预取：本页的微博不足以达到数量限制、没有早于since_date的微博，
+        且append模式下本页没有已获取过的微博。已经开始的预取无法取消，预取了用不到的页会浪费一次请求。
+        """
+        if not self.prefetch_executor or self.first_page_only:
+            return False
+        data = js.get("data") if isinstance(js, dict) else None
+        cards = data.get("cards") if isinstance(data, dict) else None
+        if not cards or self.max_weibo_count - self.got_count <= len(cards):
+            return False
+        if self.reaches_since_date(cards):
+            return False
+        return not self.cut_known_cards(cards, page)[1]
+
+    def reaches_since_date(self, cards):
+        """本页是否有早于since_date的非置顶微博"""
+        since_date = normalize_datetime(self.user_config["since_date"])
+        for card in cards:
+            if card.get("card_type") != 9 or self.is_pinned_weibo(card):
+                continue
+            created_at = standardize_date(card["mblog"]["created_at"])[0]
+            if created_at < since_date:
+                return True
+        return False
+
+    def cut_known_cards(self, cards, page):
+        """在解析前去掉已经获取过的微博
+
+        本次运行已获取的微博直接去掉；append模式下截去第一条不比high_water_id新的非置顶微博及其之后的微博。
+        微博id随发布时间递增，不大于high_water_id的微博都已在之前的运行中获取过；已获取过的置顶微博只跳过，
+        不作为结束的标志。high_water_id之外（置顶微博、query抓取）以前的运行写入过的微博按seen_ids去掉，
+        seen_ids的检查放在high_water_id之后，否则已写入的微博都被跳过，永远不会在遇到旧微博时停止。
+
+        Returns:
+            tuple: (需要解析的微博列表, 是否遇到了已获取过的非置顶微博)
+        """
+        append = const.MODE == "append"
+        if not self.weibo_ids and not (append and (self.high_water_id or self.seen_ids)):
+            return cards, False
+        new_cards = []
+        for i, w in enumerate(cards):
+            card = w
+            if card.get("card_type") == 11:
+                card = (card.get("card_group") or [card])[0] or card
+            if card.get("card_type") == 9 and "mblog" in card:
+                weibo_id = int(card["mblog"]["id"])
+                if weibo_id in self.weibo_ids:
+                    continue
+                if self.high_water_id and weibo_id <= self.high_water_id:
+                    # 微博不再显示“置顶”字样时，猜测第一页的第一条为置顶微博
+                    guess_pin = const.CHECK_COOKIE["GUESS_PIN"] and page == 1 and i == 0
+                    if self.is_pinned_weibo(card) or guess_pin:
+                        continue
+                    return new_cards, True
+                if append and self.seen_ids is not None and weibo_id in self.seen_ids:
+                    continue
+            new_cards.append(w)
+        return new_cards, False
+
     def get_one_page(self, page):
         """获取一页的全部微博"""
+        js = self.get_weibo_json(page)
+        return self.parse_one_page(js, page)
+
+    def parse_one_page(self, js, page):
+        """解析一页微博json，返回是否已经到达终点"""
         try:
-            js = self.get_weibo_json(page)
-            if js["ok"]:
+            if js.get("ok"):
                 weibos = js["data"]["cards"]
                 
                 if self.query:
                     weibos = weibos[0]["card_group"]
+                if not weibos:
+                    return True
+                # 已获取过的微博在解析前去掉，不再请求长微博全文；append模式下遇到上次的最新微博即截断
+                weibos, reached_known = self.cut_known_cards(weibos, page)
+                self.prefetch_long_weibos(weibos)
+                # 同一页的相对时间使用同一个基准时间，since_date只在每页开始时规范一次
+                self.page_now = datetime.now()
+                since_date = normalize_datetime(self.user_config["since_date"])
+                parsed = self.parse_cards_in_pool(weibos)
                 # 如果需要检查cookie，在循环第一个人的时候，就要看看仅自己可见的信息有没有，要是没有直接报错
                 for w in weibos:
                     if w["card_type"] == 11:
@@ -1316,12 +1401,8 @@ class Weibo(object):
                         else:
                             w = w
                     if w["card_type"] == 9:
-                        wb = self.get_one_weibo(w)
+                        wb = parsed[id(w)] if id(w) in parsed else self.get_one_weibo(w)
                         if wb:
-                            # 如果设置了target_bid，只处理匹配的微博
-                            if self.target_bid and wb["bid"] != self.target_bid:
-                                continue
-                                
                             if (
                                 const.CHECK_COOKIE["CHECK"]
                                 and (not const.CHECK_COOKIE["CHECKED"])
@@ -1333,13 +1414,18 @@ class Weibo(object):
                                 logger.info("cookie检查通过")
                                 if const.CHECK_COOKIE["EXIT_AFTER_CHECK"]:
                                     return True
-                            if wb["id"] in self.weibo_id_list:
+                            if wb["id"] in self.weibo_ids:
+                                continue
+                            if not self.is_pinned_weibo(w):
+                                self.cursor = min(self.cursor or wb["id"], wb["id"])
+                                if not self.newest_id or wb["id"] > self.newest_id:
+                                    self.newest_id = wb["id"]
+                                    self.newest_created_at = wb["full_created_at"]
+                            # 上次运行写完后新发布的微博会把旧微博挤到后面的页，跳过已经写入的部分
+                            if self.resume_range and self.resume_range[0] <= wb["id"] <= self.resume_range[1]:
                                 continue
-                            created_at = datetime.strptime(wb["created_at"], DTFORMAT)
-                            since_date = datetime.strptime(
-                                self.user_config["since_date"], DTFORMAT
-                            )
-                            if created_at < since_date:
+                            # 两者都是补零的yyyy-mm-ddThh:mm:ss，直接按字符串比较先后
+                            if wb["created_at"] < since_date:
                                 if self.is_pinned_weibo(w):
                                     continue
                                 elif const.CHECK_COOKIE["CHECK"] and (
@@ -1347,24 +1433,18 @@ class Weibo(object):
                                 ):
                                     continue
                                 else:
-                                    # 如果设置了target_bid且还没找到目标微博，继续搜索
-                                    if self.target_bid and not any(w["bid"] == self.target_bid for w in self.weibo):
-                                        continue
                                     return True
                             if (not self.only_crawl_original) or ("retweet" not in wb.keys()):
-                                if self.got_count >= self.max_weibo_count and not self.target_bid:
+                                if self.got_count >= self.max_weibo_count:
                                     return True
                                 self.weibo.append(wb)
-                                self.weibo_id_list.append(wb["id"])
+                                self.weibo_ids.add(wb["id"])
                                 self.got_count += 1
                                 logger.info(
                                     "已获取用户 {} 的微博，内容为 {}".format(
                                         self.user["screen_name"], wb["text"]
                                     )
                                 )
-                                # 如果找到了目标bid的微博，可以直接返回了
-                                if self.target_bid and wb["bid"] == self.target_bid:
-                                    return True
                             else:
                                 logger.info("正在过滤转发微博")
                     
@@ -1373,6 +1453,9 @@ class Weibo(object):
                     if const.NOTIFY["NOTIFY"]:
                         push_deer("经检查，cookie无效，系统退出")
                     sys.exit()
+                if reached_known:
+                    logger.info("已获取到上次运行时的最新微博，用户 %s 没有更多新微博", self.user["id"])
+                    return True
             else:
                 return True
             logger.info(
@@ -1380,12 +1463,17 @@ class Weibo(object):
                     "-" * 30, self.user["screen_name"], self.user["id"], page, "-" * 30
                 )
             )
-            # 如果设置了target_bid且还没找到目标微博，返回False继续搜索
-            if self.target_bid and not any(w["bid"] == self.target_bid for w in self.weibo):
-                return False
-            return True
+            # 只获取第一页时到此结束，设置了target_bid但还没找到目标微博时继续搜索
+            if self.first_page_only and not (
+                self.target_bid and not any(w["bid"] == self.target_bid for w in self.weibo)
+            ):
+                return True
+            # 本页没有触发结束条件，返回False继续获取下一页
+            return False
         except Exception as e:
             logger.exception(e)
+            # 解析出错的页跳过，继续获取下一页
+            return False
 
     def get_page_count(self):
         """获取微博页数"""
@@ -1411,29 +1499,16 @@ class Weibo(object):
             )
 
     def get_write_info(self, wrote_count):
-        """获取要写入的微博信息"""
+        """获取要写入csv文件的微博信息，每条微博按表头的顺序投影为一行"""
         write_info = []
         for w in self.weibo[wrote_count:]:
-            wb = OrderedDict()
-            for k, v in w.items():
-                if k not in ["user_id", "screen_name", "retweet"]:
-                    if "unicode" in str(type(v)):
-                        v = v.encode("utf-8")
-                    if k == "id":
-                        v = str(v) + "\t"
-                    wb[k] = v
+            row = WEIBO_CSV.row(w)
             if not self.only_crawl_original:
                 if w.get("retweet"):
-                    wb["is_original"] = False
-                    for k2, v2 in w["retweet"].items():
-                        if "unicode" in str(type(v2)):
-                            v2 = v2.encode("utf-8")
-                        if k2 == "id":
-                            v2 = str(v2) + "\t"
-                        wb["retweet_" + k2] = v2
+                    row += (False,) + RETWEET_CSV.row(w["retweet"])
                 else:
-                    wb["is_original"] = True
-            write_info.append(wb)
+                    row += (True,)
+            write_info.append(row)
         return write_info
 
     def get_filepath(self, type):
@@ -1462,34 +1537,15 @@ class Weibo(object):
 
     def get_result_headers(self):
         """获取要写入结果文件的表头"""
-        result_headers = [
-            "id",
-            "bid",
-            "正文",
-            "头条文章url",
-            "原始图片url",
-            "视频url",
-            "位置",
-            "日期",
-            "工具",
-            "点赞数",
-            "评论数",
-            "转发数",
-            "话题",
-            "@用户",
-            "完整日期",
-        ]
+        result_headers = list(WEIBO_CSV.columns)
         if not self.only_crawl_original:
-            result_headers2 = ["是否原创", "源用户id", "源用户昵称"]
-            result_headers3 = ["源微博" + r for r in result_headers]
-            result_headers = result_headers + result_headers2 + result_headers3
+            result_headers += ["是否原创"] + list(RETWEET_CSV.columns)
         return result_headers
 
     def write_csv(self, wrote_count):
         """将爬到的信息写入csv文件"""
-        write_info = self.get_write_info(wrote_count)
         result_headers = self.get_result_headers()
-        result_data = [w.values() for w in write_info]
+        result_data = self.get_write_info(wrote_count)
         file_path = self.get_filepath("csv")
         self.csv_helper(result_headers, result_data, file_path)
 
@@ -1521,7 +1577,7 @@ class Weibo(object):
 
     def update_json_data(self, data, weibo_info):
         """更新要写入json结果文件中的数据，已经存在于json中的信息更新为最新值，不存在的信息添加到data中"""
-        data["user"] = self.user
+        data["user"] = self.user.to_dict()
         if data.get("weibo"):
             is_new = 1  # 待写入微博是否全部为新微博，即待写入微博与json中的数据不重复
             for old in data["weibo"]:
@@ -1551,7 +1607,7 @@ class Weibo(object):
         if os.path.isfile(path):
             with codecs.open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-        weibo_info = self.weibo[wrote_count:]
+        weibo_info = [w.to_dict() for w in self.weibo[wrote_count:]]
         data = self.update_json_data(data, weibo_info)
         with codecs.open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False)
@@ -1580,8 +1636,8 @@ class Weibo(object):
     def write_post(self, wrote_count):
         """将爬到的信息通过POST发出"""
         data = {}
-        data['user'] = self.user
-        weibo_info = self.weibo[wrote_count:]
+        data['user'] = self.user.to_dict()
+        weibo_info = [w.to_dict() for w in self.weibo[wrote_count:]]
         if data.get('weibo'):
             data['weibo'] += weibo_info
         else:
@@ -1607,11 +1663,7 @@ class Weibo(object):
             client = MongoClient(self.mongodb_URI)
             db = client["weibo"]
             collection = db[collection]
-            if len(self.write_mode) > 1:
-                new_info_list = copy.deepcopy(info_list)
-            else:
-                new_info_list = info_list
-            for info in new_info_list:
+            for info in info_list:
                 if not collection.find_one({"id": info["id"]}):
                     collection.insert_one(info)
                 else:
@@ -1622,7 +1674,7 @@ class Weibo(object):
 
     def weibo_to_mongodb(self, wrote_count):
         """将爬取的微博信息写入MongoDB数据库"""
-        self.info_to_mongodb("weibo", self.weibo[wrote_count:])
+        self.info_to_mongodb("weibo", [w.to_dict() for w in self.weibo[wrote_count:]])
         logger.info("%d条微博写入MongoDB数据库完毕", self.got_count)
 
     def mysql_create(self, connection, sql):
@@ -1659,7 +1711,7 @@ class Weibo(object):
         connection = pymysql.connect(**mysql_config)
         self.mysql_create(connection, sql)
 
-    def mysql_insert(self, mysql_config, table, data_list):
+    def mysql_insert(self, mysql_config, table, columns, rows):
         """
         向MySQL表插入或更新数据
 
@@ -1669,8 +1721,10 @@ class Weibo(object):
             MySQL配置表
         table: str
             要插入的表名
-        data_list: list
-            要插入的数据列表
+        columns: tuple
+            列名
+        rows: list
+            要插入的数据列表，每行的值与columns一一对应
 
         Returns
         -------
@@ -1678,9 +1732,9 @@ class Weibo(object):
         """
         import pymysql
 
-        if len(data_list) > 0:
-            keys = ", ".join(data_list[0].keys())
-            values = ", ".join(["%s"] * len(data_list[0]))
+        if len(rows) > 0:
+            keys = ", ".join(columns)
+            values = ", ".join(["%s"] * len(columns))
             if self.mysql_config:
                 mysql_config = self.mysql_config
             mysql_config["db"] = "weibo"
@@ -1691,11 +1745,11 @@ class Weibo(object):
                 table=table, keys=keys, values=values
             )
             update = ",".join(
-                [" {key} = values({key})".format(key=key) for key in data_list[0]]
+                [" {key} = values({key})".format(key=key) for key in columns]
             )
             sql += update
             try:
-                cursor.executemany(sql, [tuple(data.values()) for data in data_list])
+                cursor.executemany(sql, rows)
                 connection.commit()
             except Exception as e:
                 connection.rollback()
@@ -1740,96 +1794,56 @@ class Weibo(object):
         weibo_list = []
         # 要插入的转发微博列表
         retweet_list = []
-        if len(self.write_mode) > 1:
-            info_list = copy.deepcopy(self.weibo[wrote_count:])
-        else:
-            info_list = self.weibo[wrote_count:]
-        for w in info_list:
-            w["created_at"] = w["full_created_at"]
-            del w["full_created_at"]
-
+        for w in self.weibo[wrote_count:]:
             if "retweet" in w:
-                r = w["retweet"]
-                r["retweet_id"] = ""
-                r["created_at"] = r["full_created_at"]
-                del r["full_created_at"]
-                retweet_list.append(r)
-                w["retweet_id"] = r["id"]
-                del w["retweet"]
-            else:
-                w["retweet_id"] = ""
-            weibo_list.append(w)
+                retweet_list.append(WEIBO_TABLE.row(w["retweet"]))
+            weibo_list.append(WEIBO_TABLE.row(w))
         # 在'weibo'表中插入或更新微博数据
-        self.mysql_insert(mysql_config, "weibo", retweet_list)
-        self.mysql_insert(mysql_config, "weibo", weibo_list)
+        self.mysql_insert(mysql_config, "weibo", WEIBO_TABLE.columns, retweet_list)
+        self.mysql_insert(mysql_config, "weibo", WEIBO_TABLE.columns, weibo_list)
         logger.info("%d条微博写入MySQL数据库完毕", self.got_count)
 
     def weibo_to_sqlite(self, wrote_count):
-        con = self.get_sqlite_connection()
-        weibo_list = []
-        retweet_list = []
-        info_list = copy.deepcopy(self.weibo[wrote_count:])
-        for w in info_list:
-            if "retweet" in w:
-                w["retweet"]["retweet_id"] = ""
-                retweet_list.append(w["retweet"])
-                w["retweet_id"] = w["retweet"]["id"]
-                del w["retweet"]
-            else:
-                w["retweet_id"] = ""
-            weibo_list.append(w)
+        weibo_list = self.weibo[wrote_count:]
+        retweet_list = [w["retweet"] for w in weibo_list if "retweet" in w]
 
         comment_max_count = self.comment_max_download_count
         repost_max_count = self.comment_max_download_count
         download_comment = self.download_comment and comment_max_count > 0
         download_repost = self.download_repost and repost_max_count > 0
 
-        count = 0
+        self.sqlite_db.insert_records("weibo", WEIBO_TABLE, weibo_list)
         for weibo in weibo_list:
-            self.sqlite_insert_weibo(con, weibo)
             if (download_comment) and (weibo["comments_count"] > 0):
                 self.get_weibo_comments(
                     weibo, comment_max_count, self.sqlite_insert_comments
                 )
-                count += 1
-                if count % 20:
-                    sleep(random.randint(3, 6))
             if (download_repost) and (weibo["reposts_count"] > 0):
                 self.get_weibo_reposts(
                     weibo, repost_max_count, self.sqlite_insert_reposts
                 )
-                count += 1
-                if count % 20:
-                    sleep(random.randint(3, 6))
 
-        for weibo in retweet_list:
-            self.sqlite_insert_weibo(con, weibo)
-        con.close()
+        self.sqlite_db.insert_records("weibo", WEIBO_TABLE, retweet_list)
+        # 本页写完后提交，保证记录抓取进度时数据已经落盘
+        self.sqlite_db.commit()
 
     def sqlite_insert_comments(self, weibo, comments):
         if not comments or len(comments) == 0:
             return
-        con = self.get_sqlite_connection()
-        for comment in comments:
-            data = self.parse_sqlite_comment(comment, weibo)
-            self.sqlite_insert(con, data, "comments")
-
-        con.close()
+        # 每页评论一次写入
+        records = [self.parse_sqlite_comment(comment, weibo) for comment in comments]
+        self.sqlite_db.insert_records("comments", COMMENT_TABLE, [r for r in records if r])
 
     def sqlite_insert_reposts(self, weibo, reposts):
         if not reposts or len(reposts) == 0:
             return
-        con = self.get_sqlite_connection()
-        for repost in reposts:
-            data = self.parse_sqlite_repost(repost, weibo)
-            self.sqlite_insert(con, data, "reposts")
-
-        con.close()
+        records = [self.parse_sqlite_repost(repost, weibo) for repost in reposts]
+        self.sqlite_db.insert_records("reposts", REPOST_TABLE, [r for r in records if r])
 
     def parse_sqlite_comment(self, comment, weibo):
         if not comment:
             return
-        sqlite_comment = OrderedDict()
+        sqlite_comment = CommentRecord()
         sqlite_comment["id"] = comment["id"]
 
         self._try_get_value("bid", "bid", sqlite_comment, comment)
@@ -1843,7 +1857,7 @@ class Weibo(object):
             "user_avatar_url", "avatar_hd", sqlite_comment, comment["user"]
         )
         if self.remove_html_tag:
-            sqlite_comment["text"] = re.sub('<[^<]+?>', '', comment["text"]).replace('\n', '').strip()
+            sqlite_comment["text"] = strip_tags(comment["text"]).replace('\n', '').strip()
         else:
             sqlite_comment["text"] = comment["text"]
         
@@ -1856,7 +1870,7 @@ class Weibo(object):
     def parse_sqlite_repost(self, repost, weibo):
         if not repost:
             return
-        sqlite_repost = OrderedDict()
+        sqlite_repost = RepostRecord()
         sqlite_repost["id"] = repost["id"]
 
         self._try_get_value("bid", "bid", sqlite_repost, repost)
@@ -1883,178 +1897,35 @@ class Weibo(object):
         if value:
             dict[source_name] = value
 
-    def sqlite_insert_weibo(self, con: sqlite3.Connection, weibo: dict):
-        sqlite_weibo = self.parse_sqlite_weibo(weibo)
-        self.sqlite_insert(con, sqlite_weibo, "weibo")
-
-    def parse_sqlite_weibo(self, weibo):
-        if not weibo:
-            return
-        sqlite_weibo = OrderedDict()
-        sqlite_weibo["user_id"] = weibo["user_id"]
-        sqlite_weibo["id"] = weibo["id"]
-        sqlite_weibo["bid"] = weibo["bid"]
-        sqlite_weibo["screen_name"] = weibo["screen_name"]
-        sqlite_weibo["text"] = weibo["text"]
-        sqlite_weibo["article_url"] = weibo["article_url"]
-        sqlite_weibo["topics"] = weibo["topics"]
-        sqlite_weibo["pics"] = weibo["pics"]
-        sqlite_weibo["video_url"] = weibo["video_url"]
-        sqlite_weibo["location"] = weibo["location"]
-        sqlite_weibo["created_at"] = weibo["full_created_at"]
-        sqlite_weibo["source"] = weibo["source"]
-        sqlite_weibo["attitudes_count"] = weibo["attitudes_count"]
-        sqlite_weibo["comments_count"] = weibo["comments_count"]
-        sqlite_weibo["reposts_count"] = weibo["reposts_count"]
-        sqlite_weibo["retweet_id"] = weibo["retweet_id"]
-        sqlite_weibo["at_users"] = weibo["at_users"]
-        return sqlite_weibo
-
     def user_to_sqlite(self):
-        con = self.get_sqlite_connection()
-        self.sqlite_insert_user(con, self.user)
-        con.close()
+        self.sqlite_insert_user(self.user)
 
-    def sqlite_insert_user(self, con: sqlite3.Connection, user: dict):
-        sqlite_user = self.parse_sqlite_user(user)
-        self.sqlite_insert(con, sqlite_user, "user")
+    def sqlite_insert_user(self, user: UserRecord):
+        self.sqlite_insert_row("user", USER_SQLITE_TABLE.columns, USER_SQLITE_TABLE.row(user))
 
-    def parse_sqlite_user(self, user):
-        if not user:
-            return
-        sqlite_user = OrderedDict()
-        sqlite_user["id"] = user["id"]
-        sqlite_user["nick_name"] = user["screen_name"]
-        sqlite_user["gender"] = user["gender"]
-        sqlite_user["follower_count"] = user["followers_count"]
-        sqlite_user["follow_count"] = user["follow_count"]
-        sqlite_user["birthday"] = user["birthday"]
-        sqlite_user["location"] = user["location"]
-        sqlite_user["edu"] = user["education"]
-        sqlite_user["company"] = user["company"]
-        sqlite_user["reg_date"] = user["registration_time"]
-        sqlite_user["main_page_url"] = user["profile_url"]
-        sqlite_user["avatar_url"] = user["avatar_hd"]
-        sqlite_user["bio"] = user["description"]
-        return sqlite_user
-
-    def sqlite_insert(self, con: sqlite3.Connection, data: dict, table: str):
+    def sqlite_insert(self, data: dict, table: str):
         if not data:
             return
-        cur = con.cursor()
-        keys = ",".join(data.keys())
-        values = ",".join(["?"] * len(data))
-        sql = """INSERT OR REPLACE INTO {table}({keys}) VALUES({values})
-                """.format(
-            table=table, keys=keys, values=values
-        )
-        cur.execute(sql, list(data.values()))
-        con.commit()
-
-    def get_sqlite_connection(self):
-        path = self.get_sqlte_path()
-        create = False
-        if not os.path.exists(path):
-            create = True
-
-        con = sqlite3.connect(path)
-
-        if create == True:
-            self.create_sqlite_table(connection=con)
-
-        return con
+        self.sqlite_insert_row(table, data.keys(), list(data.values()))
 
-    def create_sqlite_table(self, connection: sqlite3.Connection):
-        sql = self.get_sqlite_create_sql()
-        cur = connection.cursor()
-        cur.executescript(sql)
-        connection.commit()
+    def sqlite_insert_row(self, table: str, columns, row):
+        """按列名插入一行数据，由sqlite_db成批提交"""
+        self.sqlite_db.insert_many(table, columns, [row])
 
     def get_sqlte_path(self):
         return "./weibo/weibodata.db"
 
-    def get_sqlite_create_sql(self):
-        create_sql = """
-                CREATE TABLE IF NOT EXISTS user (
-                    id varchar(64) NOT NULL
-                    ,nick_name varchar(64) NOT NULL
-                    ,gender varchar(6)
-                    ,follower_count integer
-                    ,follow_count integer
-                    ,birthday varchar(10)
-                    ,location varchar(32)
-                    ,edu varchar(32)
-                    ,company varchar(32)
-                    ,reg_date DATETIME
-                    ,main_page_url text
-                    ,avatar_url text
-                    ,bio text
-                    ,PRIMARY KEY (id)
-                );
-
-                CREATE TABLE IF NOT EXISTS weibo (
-                    id varchar(20) NOT NULL
-                    ,bid varchar(12) NOT NULL
-                    ,user_id varchar(20)
-                    ,screen_name varchar(30)
-                    ,text varchar(2000)
-                    ,article_url varchar(100)
-                    ,topics varchar(200)
-                    ,at_users varchar(1000)
-                    ,pics varchar(3000)
-                    ,video_url varchar(1000)
-                    ,location varchar(100)
-                    ,created_at DATETIME
-                    ,source varchar(30)
-                    ,attitudes_count INT
-                    ,comments_count INT
-                    ,reposts_count INT
-                    ,retweet_id varchar(20)
-                    ,PRIMARY KEY (id)
-                );
-
-                CREATE TABLE IF NOT EXISTS bins (
-                    id integer PRIMARY KEY AUTOINCREMENT
-                    ,ext varchar(10) NOT NULL /*file extension*/
-                    ,data blob NOT NULL
-                    ,weibo_id varchar(20)
-                    ,comment_id varchar(20)
-                    ,path text
-                    ,url text
-                );
-
-                CREATE TABLE IF NOT EXISTS comments (
-                    id varchar(20) NOT NULL
-                    ,bid varchar(20) NOT NULL
-                    ,weibo_id varchar(32) NOT NULL
-                    ,root_id varchar(20) 
-                    ,user_id varchar(20) NOT NULL
-                    ,created_at varchar(20)
-                    ,user_screen_name varchar(64) NOT NULL
-                    ,user_avatar_url text
-                    ,text varchar(1000)
-                    ,pic_url text
-                    ,like_count integer
-                    ,PRIMARY KEY (id)
-                );
-
-                CREATE TABLE IF NOT EXISTS reposts (
-                    id varchar(20) NOT NULL
-                    ,bid varchar(20) NOT NULL
-                    ,weibo_id varchar(32) NOT NULL
-                    ,user_id varchar(20) NOT NULL
-                    ,created_at varchar(20)
-                    ,user_screen_name varchar(64) NOT NULL
-                    ,user_avatar_url text
-                    ,text varchar(1000)
-                    ,like_count integer
-                    ,PRIMARY KEY (id)
-                );
-                """
-        return create_sql
+    def record_since_date(self):
+        """记录当前用户下次运行的起始时间，用户配置文件在运行结束时统一更新"""
+        self.crawl_state.set_since_date(
+            self.user_config["user_id"], self.user["screen_name"], self.start_date
+        )
 
     def update_user_config_file(self, user_config_file_path):
-        """更新用户配置文件"""
+        """把本次运行记录的起始时间一次性写回用户配置文件"""
+        pending = self.crawl_state.get_pending_since_dates()
+        if not pending:
+            return
         with open(user_config_file_path, "rb") as f:
             try:
                 lines = f.read().splitlines()
@@ -2064,23 +1935,32 @@ class Weibo(object):
                 sys.exit()
             for i, line in enumerate(lines):
                 info = line.split(" ")
-                if len(info) > 0 and info[0].isdigit():
-                    if self.user_config["user_id"] == info[0]:
-                        if len(info) == 1:
-                            info.append(self.user["screen_name"])
-                            info.append(self.start_date)
-                        if len(info) == 2:
-                            info.append(self.start_date)
-                        if len(info) > 2:
-                            info[2] = self.start_date
-                        lines[i] = " ".join(info)
-                        break
+                if len(info) > 0 and info[0] in pending:
+                    screen_name, start_date = pending[info[0]]
+                    if len(info) == 1:
+                        info.append(screen_name)
+                        info.append(start_date)
+                    if len(info) == 2:
+                        info.append(start_date)
+                    if len(info) > 2:
+                        info[2] = start_date
+                    lines[i] = " ".join(info)
         with codecs.open(user_config_file_path, "w", encoding="utf-8") as f:
             f.write("\n".join(lines))
+        self.crawl_state.clear_pending_since_dates(pending)
+
+    def export_user_state(self):
+        """运行结束时导出users.csv并更新用户配置文件"""
+        try:
+            self.export_users_csv()
+            if self.user_config_file_path:
+                self.update_user_config_file(self.user_config_file_path)
+        except Exception as e:
+            logger.exception(e)
 
     def write_data(self, wrote_count):
         """将爬到的信息写入文件或数据库"""
-        if self.got_count > wrote_count:
+        if len(self.weibo) > wrote_count:
             if "csv" in self.write_mode:
                 self.write_csv(wrote_count)
             if "json" in self.write_mode:
@@ -2108,38 +1988,111 @@ class Weibo(object):
                 if self.retweet_live_photo_download:
                     self.download_files("live_photo", "retweet", wrote_count)
 
-    def get_pages(self):
-        """获取全部微博"""
+    def begin_pages(self):
+        """抓取某个用户的微博前的准备工作，返回是否需要继续抓取"""
+        logger.info("准备搜集 {} 的微博".format(self.user["screen_name"]))
+        if const.MODE == "append" and (
+            "first_crawler" not in self.__dict__ or self.first_crawler is False
+        ):
+            # 本次运行的某用户首次抓取，用于标记最新的微博id
+            self.first_crawler = True
+            const.CHECK_COOKIE["GUESS_PIN"] = True
+        if const.MODE == "append" and not self.query:
+            high_water = self.crawl_state.get_high_water(self.user_config["user_id"])
+            if high_water and high_water.newest_id:
+                self.high_water_id = high_water.newest_id
+                logger.info(
+                    "append模式：只获取 %s 之后发布的微博（id大于%d）",
+                    high_water.newest_created_at,
+                    high_water.newest_id,
+                )
+        since_date = datetime.strptime(self.user_config["since_date"], DTFORMAT)
+        today = datetime.today()
+        if since_date > today:    # since_date 若为未来则无需执行
+            return False
+        self.start_date = datetime.now().strftime(DTFORMAT)
+        return True
+
+    def flush_page(self, page):
+        """把本页获取的微博写入各个输出并记录抓取进度，写入后不再保留在内存中"""
+        self.write_data(0)
+        if self.seen_ids is not None:
+            for wb in self.weibo:
+                self.seen_ids.add(wb["id"])
+            self.seen_ids.flush()
+        self.weibo = []
+        self.crawl_state.save_checkpoint(
+            self.user_config["user_id"],
+            self.query,
+            page,
+            self.cursor,
+            self.newest_id,
+            self.newest_created_at,
+            self.got_count,
+        )
+
+    def finish_checkpoint(self):
+        """标记当前用户、当前query已经抓取完毕，并记录用户的最新微博供append模式使用"""
+        self.crawl_state.finish_checkpoint(self.user_config["user_id"], self.query)
+        if self.newest_id and not self.query:
+            self.crawl_state.update_high_water(
+                self.user_config["user_id"], self.newest_id, self.newest_created_at
+            )
+
+    def load_checkpoint(self):
+        """读取上次运行的抓取进度，返回开始的页码和已经获取的微博数
+
+        上次运行没有抓取完毕时从最后写完的页的下一页继续；手动设置了start_page时以start_page为准。
+        """
+        checkpoint = self.crawl_state.get_checkpoint(self.user_config["user_id"], self.query)
+        if checkpoint is None or checkpoint.finished:
+            return self.start_page, 0
+        if self.start_page > 1:
+            logger.info("已设置start_page，忽略上次运行的抓取进度，从第%d页开始", self.start_page)
+            return self.start_page, 0
+        self.cursor = checkpoint.cursor
+        self.newest_id = checkpoint.newest_id
+        self.newest_created_at = checkpoint.newest_created_at
+        if checkpoint.cursor and checkpoint.newest_id:
+            self.resume_range = (checkpoint.cursor, checkpoint.newest_id)
+        logger.info(
+            "用户 %s 上次运行已写入到第%d页，从第%d页继续",
+            self.user_config["user_id"],
+            checkpoint.page,
+            checkpoint.page + 1,
+        )
+        return checkpoint.page + 1, checkpoint.got_count
+
+    def get_pages(self, start_page=1):
+        """获取全部微博，遇到验证码时抛出CrawlBlocked，由调用方放入隔离区"""
         try:
             # 用户id不可用
             if self.get_user_info() != 0:
                 return
-            logger.info("准备搜集 {} 的微博".format(self.user["screen_name"]))
-            if const.MODE == "append" and (
-                "first_crawler" not in self.__dict__ or self.first_crawler is False
-            ):
-                # 本次运行的某用户首次抓取，用于标记最新的微博id
-                self.first_crawler = True
-                const.CHECK_COOKIE["GUESS_PIN"] = True
-            since_date = datetime.strptime(self.user_config["since_date"], DTFORMAT)
-            today = datetime.today()
-            if since_date <= today:    # since_date 若为未来则无需执行
-                wrote_count = 0
-                page1 = 0
-                self.start_date = datetime.now().strftime(DTFORMAT)
-                
-                # 只获取第一页
-                is_end = self.get_one_page(1)
-                if not is_end and self.got_count < self.max_weibo_count:
-                    # 如果第一页获取的微博数量不够，继续获取下一页，直到达到限制
-                    page = 2
+            if self.begin_pages():
+                page = start_page
+                is_end = False
+                next_page = None
+                try:
+                    # 逐页获取，直到没有更多微博或达到数量限制；解析本页的同时预取下一页
                     while not is_end and self.got_count < self.max_weibo_count:
-                        is_end = self.get_one_page(page)
+                        js = next_page.result() if next_page else self.get_weibo_json(page)
+                        next_page = None
+                        if self.need_next_page(js, page):
+                            next_page = self.prefetch_executor.submit(self.get_weibo_json, page + 1)
+                        is_end = self.parse_one_page(js, page)
+                        self.flush_page(page)
                         page += 1
-                        sleep(random.randint(1, 3))  # 添加短暂延迟
-
-                self.write_data(wrote_count)  # 将获取到的微博写入文件
+                    self.finish_checkpoint()
+                finally:
+                    if next_page:
+                        next_page.cancel()
+                    self.long_weibo_futures = {}
+                    self.write_data(0)  # 将获取到的微博写入文件，被阻断时也保留已获取的部分
+                    self.weibo = []
             logger.info("微博爬取完成，共爬取%d条微博", self.got_count)
+        except CrawlBlocked:
+            raise
         except Exception as e:
             logger.exception(e)
 
@@ -2188,26 +2141,131 @@ class Weibo(object):
         self.user = {}
         self.user_config = user_config
         self.got_count = 0
-        self.weibo_id_list = []
+        self.weibo_ids = set()
+        self.long_weibo_futures = {}
+        self.page_now = None  # 当前页解析相对时间的基准时间
+        self.cursor = None
+        self.newest_id = None
+        self.newest_created_at = None
+        self.high_water_id = None
+        self.resume_range = None
+
+    def fork(self, user_config, query=""):
+        """复制出一个共享配置与会话、但抓取状态独立的爬虫，供并发抓取多个用户时使用"""
+        worker = copy.copy(self)
+        worker.query = query
+        worker.initialize_info(user_config)
+        return worker
+
+    def crawl_query(self, user_config, query="", page=None, got_count=0):
+        """抓取一个用户的一个query，被验证码阻断时放入隔离区并返回False
+
+        page和got_count为重试隔离任务时继续抓取的页码和之前已经抓取的微博数，
+        page为None时从上次运行的抓取进度继续。
+        """
+        self.query = query
+        self.initialize_info(user_config)
+        if page is None:
+            page, got_count = self.load_checkpoint()
+        self.got_count = got_count
+        try:
+            self.get_pages(page)
+            return True
+        except CrawlBlocked as e:
+            self.quarantine.add(
+                user_config, query, e.page or page, self.got_count, e.reason, e.captcha_url
+            )
+            return False
+
+    def crawl_bid(self, bid):
+        """单条微博模式：通过statuses/show一次请求获取指定bid的微博，并写入各个输出
+
+        微博json中自带作者信息，无需再请求用户主页，也不需要逐页翻找。
+        """
+        url = "https://m.weibo.cn/statuses/show"
+        bid = normalize_input(bid)
+        js, signal = self.fetch_json(url, params={"id": bid}, timeout=10)
+        weibo_info = js.get("data") if signal == "ok" else None
+        if not isinstance(weibo_info, dict) or not weibo_info.get("id"):
+            logger.error(f"未能获取到BID为 {bid} 的微博（{signal}）")
+            return False
+        user_info = weibo_info.get("user") or {}
+        self.initialize_info(
+            {"user_id": str(user_info.get("id", "")), "since_date": self.since_date, "query_list": []}
+        )
+        self.user = self.build_user_info(user_info, {})
+        self.user_to_database()
+        wb = self.get_one_weibo({"mblog": weibo_info})
+        if not wb:
+            return False
+        if self.only_crawl_original and "retweet" in wb:
+            logger.info(f"BID为 {bid} 的微博是转发微博，已按only_crawl_original过滤")
+            return False
+        self.weibo.append(wb)
+        self.weibo_ids.add(wb["id"])
+        self.got_count = 1
+        logger.info("已获取用户 {} 的微博，内容为 {}".format(self.user["screen_name"], wb["text"]))
+        self.write_data(0)
+        return True
+
+    def on_captcha_resolved(self):
+        """验证码处理后重新读取config.json中的cookie，并恢复被暂停的cookie"""
+        try:
+            with open(self.config_path, encoding="utf-8") as f:
+                config = json.load(f)
+            cookies = get_config_cookies(config)
+        except (OSError, ValueError) as e:
+            logger.warning(f"重新读取cookie失败：{e}")
+            cookies = []
+        self.cookie_pool.reload(cookies)
+        if cookies:
+            self.headers["Cookie"] = cookies[0]
+
+    def retry_quarantined(self):
+        """等待并重试隔离区中的任务，直到隔离区为空"""
+        while len(self.quarantine):
+            logger.info("隔离区中还有%d个任务，等待重试...", len(self.quarantine))
+            items, resolved = self.quarantine.wait()
+            if resolved:
+                self.on_captcha_resolved()
+            for item in items:
+                logger.info("重试用户 %s，从第%d页继续", item.user_config["user_id"], item.page)
+                worker = self.fork(item.user_config, item.query)
+                if worker.crawl_query(item.user_config, item.query, item.page, item.got_count):
+                    if self.user_config_file_path and worker.user:
+                        worker.record_since_date()
 
     def start(self):
         """运行爬虫"""
         try:
+            if self.target_bid:
+                self.crawl_bid(self.target_bid)
+                return
             for user_config in self.user_config_list:
-                if len(user_config["query_list"]):
-                    for query in user_config["query_list"]:
-                        self.query = query
-                        self.initialize_info(user_config)
-                        self.get_pages()
-                else:
-                    self.initialize_info(user_config)
-                    self.get_pages()
+                for query in user_config["query_list"] or [""]:
+                    self.crawl_query(user_config, query)
                 logger.info("信息抓取完毕")
                 logger.info("*" * 100)
                 if self.user_config_file_path and self.user:
-                    self.update_user_config_file(self.user_config_file_path)
+                    self.record_since_date()
+            self.retry_quarantined()
         except Exception as e:
             logger.exception(e)
+        finally:
+            self.export_user_state()
+            self.close()
+
+    def close(self):
+        """运行结束时提交未写完的数据并释放线程池、进程池和数据库连接，同时输出cookie的健康情况"""
+        self.cookie_pool.log_stats()
+        if self.parse_executor:
+            self.parse_executor.shutdown()
+        if self.prefetch_executor:
+            self.prefetch_executor.shutdown(cancel_futures=True)
+        self.sqlite_db.close()
+        self.crawl_state.close()
+        if self.seen_ids is not None:
+            self.seen_ids.close()
 
 
 def handle_config_renaming(config, oldName, newName):
@@ -2238,11 +2296,31 @@ def get_config():
         sys.exit()
 
 
+def parse_args():
+    """解析命令行参数，命令行中的设置优先于config.json"""
+    parser = argparse.ArgumentParser(description="微博爬虫")
+    parser.add_argument("--bid", help="只获取这一条微博，可以是bid、微博id或微博链接")
+    parser.add_argument(
+        "--only-crawl-original", action="store_true", help="只获取原创微博"
+    )
+    return parser.parse_args()
+
+
 def main():
     try:
+        args = parse_args()
         config = get_config()
+        if args.bid:
+            config["target_bid"] = args.bid
+        if args.only_crawl_original:
+            config["only_crawl_original"] = 1
         wb = Weibo(config)
-        wb.start()  # 爬取微博信息
+        if wb.target_bid:
+            wb.start()  # 单条微博模式
+        elif wb.async_concurrency > 1:
+            AsyncCrawler(wb, wb.async_concurrency).run()  # 并发爬取多个用户的微博信息
+        else:
+            wb.start()  # 爬取微博信息
         if const.NOTIFY["NOTIFY"]:
             push_deer("更新了一次微博")
     except Exception as e: